@@ -0,0 +1,84 @@
+// Decodificador de referência da telemetria binária publicada pelo servidor
+// (transmissao_camera.py, seção TELEMETRIA BINÁRIA). Uso com paho-mqtt:
+//   const dados = decodificarTelemetria(msg.payloadBytes as Uint8Array);
+
+export const TOPICO_BIN_DETECCAO = 'dados/bin/deteccao';
+export const TOPICO_BIN_STATUS = 'dados/bin/status';
+export const TOPICO_BIN_DESCOBERTA = 'dados/bin/descoberta';
+
+const VERSAO = 1;
+const TIPO_DETECCAO = 1;
+const TIPO_STATUS = 2;
+const TIPO_DESCOBERTA = 3;
+
+// Mesma ordem de CORES_CONHECIDAS no servidor
+const CORES = ['Vermelho', 'Azul', 'Amarelo', 'Verde', 'Laranja', 'Roxo'];
+
+export type Deteccao = { cor: string | null; x: number; y: number; raio: number };
+
+export type Telemetria =
+  | { tipo: 'deteccao'; seq: number; tCaptura: number; camera: string; deteccoes: Deteccao[] }
+  | { tipo: 'status'; esteiraLigada: boolean; contagens: Record<string, number> }
+  | { tipo: 'descoberta'; ip: string | null; urlLocal: string | null; urlTunel: string | null };
+
+const nomeCor = (codigo: number) => CORES[codigo] ?? null;
+
+export function decodificarTelemetria(payload: Uint8Array): Telemetria {
+  const view = new DataView(payload.buffer, payload.byteOffset, payload.byteLength);
+  const decoder = new TextDecoder();
+  let pos = 0;
+
+  const lerTexto = (bytesTamanho: 1 | 2) => {
+    const tamanho = bytesTamanho === 1 ? view.getUint8(pos) : view.getUint16(pos);
+    pos += bytesTamanho;
+    const texto = decoder.decode(payload.subarray(pos, pos + tamanho));
+    pos += tamanho;
+    return texto;
+  };
+
+  const versao = view.getUint8(0);
+  const tipo = view.getUint8(1);
+  pos = 2;
+  if (versao !== VERSAO) {
+    throw new Error(`Versão de telemetria não suportada: ${versao}`);
+  }
+
+  if (tipo === TIPO_DETECCAO) {
+    const seq = view.getUint32(pos);
+    const tCaptura = Number(view.getBigUint64(pos + 4)) / 1000;
+    pos += 12;
+    const camera = lerTexto(1);
+    const quantidade = view.getUint8(pos);
+    pos += 1;
+    const deteccoes: Deteccao[] = [];
+    for (let i = 0; i < quantidade; i++, pos += 7) {
+      deteccoes.push({
+        cor: nomeCor(view.getUint8(pos)),
+        x: view.getUint16(pos + 1),
+        y: view.getUint16(pos + 3),
+        raio: view.getUint16(pos + 5),
+      });
+    }
+    return { tipo: 'deteccao', seq, tCaptura, camera, deteccoes };
+  }
+
+  if (tipo === TIPO_STATUS) {
+    const flags = view.getUint8(pos);
+    const quantidade = view.getUint8(pos + 1);
+    pos += 2;
+    const contagens: Record<string, number> = {};
+    for (let i = 0; i < quantidade; i++, pos += 5) {
+      contagens[nomeCor(view.getUint8(pos)) ?? 'desconhecida'] = view.getUint32(pos + 1);
+    }
+    return { tipo: 'status', esteiraLigada: (flags & 1) === 1, contagens };
+  }
+
+  if (tipo === TIPO_DESCOBERTA) {
+    const ip = lerTexto(2) || null;
+    const urlLocal = lerTexto(2) || null;
+    const urlTunel = lerTexto(2) || null;
+    return { tipo: 'descoberta', ip, urlLocal, urlTunel };
+  }
+
+  throw new Error(`Tipo de telemetria desconhecido: ${tipo}`);
+}
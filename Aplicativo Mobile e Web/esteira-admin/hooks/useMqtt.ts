@@ -3,6 +3,10 @@ import { useEffect, useState } from 'react';
 
 type LogEntry = { time: string; value: string };
 
+// Um tópico de rastreio por câmera: dados/camera/<cam>/rastreio
+const TOPICO_RASTREIO = 'dados/camera/+/rastreio';
+const TOPICO_LATENCIA = 'dados/app/latencia';
+
 export function informacoesMqtt(topicoPadraoReceber: string = 'dados/camera', topicoPadraoEnviar: string = "dados/app") {
   const [client, setClient] = useState<Client | null>(null);
   const [message, setMessage] = useState('');
@@ -17,6 +21,7 @@ export function informacoesMqtt(topicoPadraoReceber: string = 'dados/camera', to
   const [ultimaMsg, setUltimaMsg] = useState('');
   const [topicoMsgReceber, setTopicoMsgReceber] = useState(topicoPadraoReceber);
   const [topicoMsgEnviar, setTopicoMsgEnviar] = useState(topicoPadraoEnviar);
+  const [latenciaMs, setLatenciaMs] = useState<number | null>(null);
 
 
 useEffect(() => {
@@ -33,6 +38,7 @@ useEffect(() => {
       password: 'brokerP&x+e[5&ifZ_R}T',
       onSuccess: () => {
         mqttClient.subscribe(topicoMsgReceber);
+        mqttClient.subscribe(TOPICO_RASTREIO);
         setClient(mqttClient);
         setLoading(false);
       },
@@ -41,6 +47,22 @@ useEffect(() => {
 
     mqttClient.onMessageArrived = (msg: Message) => {
       const p = msg.payloadString ?? '';
+
+      // Rastreio de latência: devolve ao servidor o atraso desde a captura
+      if (msg.destinationName.endsWith('/rastreio')) {
+        try {
+          const rastreio = JSON.parse(p);
+          const deltaMs = Date.now() - rastreio.t_captura * 1000;
+          setLatenciaMs(deltaMs);
+          const resposta = new Message(JSON.stringify({ camera: rastreio.camera, seq: rastreio.seq, delta_ms: deltaMs }));
+          resposta.destinationName = TOPICO_LATENCIA;
+          mqttClient.send(resposta);
+        } catch (err) {
+          console.error('Rastreio inválido:', err);
+        }
+        return;
+      }
+
       const time = new Date().toLocaleString();
       setMessage(p);
       setLogs(prev => [...prev, { time, value: p }]);
@@ -124,6 +146,7 @@ useEffect(() => {
     corndef,
     logs,
     ultimaMsg,
+    latenciaMs,
     alterarEstadoEsteira,
     setTopicoMsgEnviar,
     setTopicoMsgReceber,
@@ -10,11 +10,8 @@ start "" ngrok.exe config add-authtoken 2wNhqWx8JwAhD4O1nxxqJVvtpEB_prCM4myKWKcH
 :: Abre o túnel
 start "" ngrok.exe http 5000
 
-:: Espera o túnel estar pronto
-timeout /t 15 /nobreak > nul
-
-:: Envia a info via MQTT
-start "" python enviar_info.py
+:: A URL do túnel é publicada em ngrok/ip (retida) pelo MonitorRede do
+:: transmissao_camera.py, o único publicador desse tópico
 
 endlocal
 pause
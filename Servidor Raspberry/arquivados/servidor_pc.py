@@ -10,7 +10,7 @@ import threading
 import json
 import base64
 import io
-from flask import Flask, Response, jsonify, send_file
+from flask import Flask, Response, jsonify, send_file, request
 from flask_cors import CORS
 import paho.mqtt.client as mqtt
 import time
@@ -33,6 +33,7 @@ camera = None
 streaming_active = False
 use_test_image = False
 current_frame = None
+frame_seq = 0
 frame_lock = threading.Lock()
 
 def get_local_ip():
@@ -114,7 +115,7 @@ def init_camera():
 
 def capture_frames():
     """Thread para capturar frames continuamente"""
-    global camera, current_frame, streaming_active, use_test_image, frame_lock
+    global camera, current_frame, frame_seq, streaming_active, use_test_image, frame_lock
     
     while True:
         try:
@@ -141,6 +142,7 @@ def capture_frames():
             # Atualiza frame atual de forma thread-safe
             with frame_lock:
                 current_frame = frame.copy()
+                frame_seq += 1
                 
         except Exception as e:
             print(f"Erro ao capturar frame: {e}")
@@ -202,10 +204,23 @@ def video_feed():
 
 @app.route('/frame')
 def single_frame():
-    """Endpoint para frame único (melhor compatibilidade mobile)"""
+    """Endpoint para frame único (melhor compatibilidade mobile)
+    
+    O ETag é o número de sequência do frame; se o cliente já tem o frame
+    atual (If-None-Match), responde 304 sem reenviar a imagem.
+    """
+    with frame_lock:
+        etag = str(frame_seq)
+    if frame_seq and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    
     frame_data = get_current_frame_jpeg()
     if frame_data:
-        return Response(frame_data, mimetype='image/jpeg')
+        response = Response(frame_data, mimetype='image/jpeg', headers={'Cache-Control': 'no-cache'})
+        response.set_etag(etag)
+        return response
     else:
         return "Erro ao capturar frame", 500
 
@@ -316,6 +331,9 @@ def video_html():
             let refreshInterval = null;
             let frameCount = 0;
             let lastFpsTime = Date.now();
+            let frameEtag = null;
+            let frameUrl = null;
+            let carregando = false;
             
             const img = document.getElementById('video-stream');
             const status = document.getElementById('status');
@@ -355,7 +373,7 @@ def video_html():
                         break;
                         
                     case 'manual':
-                        img.src = '/frame?' + Date.now();
+                        refreshFrame();
                         methodInfo.textContent = 'Método: Manual (clique para atualizar)';
                         refreshBtn.disabled = false;
                         status.textContent = 'Modo manual - clique para atualizar';
@@ -369,12 +387,27 @@ def video_html():
                 }}, 100); // 10 FPS
             }}
             
-            function refreshFrame() {{
-                if (currentMethod === 'mjpeg') return;
-                
-                const timestamp = Date.now();
-                img.src = '/frame?t=' + timestamp;
-                updateFPS();
+            // URL fixa com o último ETag: frame repetido volta 304, sem imagem
+            async function refreshFrame() {{
+                if (currentMethod === 'mjpeg' || carregando) return;
+                carregando = true;
+                try {{
+                    const headers = frameEtag ? {{'If-None-Match': frameEtag}} : {{}};
+                    const resposta = await fetch('/frame', {{headers, cache: 'no-store'}});
+                    if (resposta.status === 304) return;
+                    if (!resposta.ok) throw new Error('HTTP ' + resposta.status);
+                    frameEtag = resposta.headers.get('ETag');
+                    const blob = await resposta.blob();
+                    if (frameUrl) URL.revokeObjectURL(frameUrl);
+                    frameUrl = URL.createObjectURL(blob);
+                    img.src = frameUrl;
+                    updateFPS();
+                }} catch (e) {{
+                    status.textContent = 'Erro ao carregar frame';
+                    console.error('Erro ao carregar frame', e);
+                }} finally {{
+                    carregando = false;
+                }}
             }}
             
             // Event listeners
@@ -0,0 +1,155 @@
+"""
+Detector de cores LEGO e protocolo da detecção remota
+
+Compartilhado entre o servidor do Raspberry (transmissao_camera.py) e o
+worker de detecção (worker_deteccao.py). Depende só de OpenCV e NumPy:
+importar este módulo não cria o app Flask, os clientes MQTT nem lê o
+perfil.json.
+"""
+
+import struct
+
+import cv2
+import numpy as np
+
+DETECCAO_REMOTA_PORTA = 5600
+KERNEL_PADRAO = 5
+
+# ==============================
+# DETECTOR DE CORES LEGO
+# ==============================
+class LegoColorDetector:
+    def __init__(self, perfil=None):
+        """
+        Args:
+            perfil (Mapping, optional): Fonte de "largura_deteccao" e
+                "kernel", consultada a cada quadro (no servidor, o
+                GerenciadorPerfis). None detecta no tamanho recebido, com
+                kernel tamanho_kernel
+        """
+        self.perfil = perfil
+        self.tamanho_kernel = KERNEL_PADRAO
+        self.colors = {
+            "Vermelho": ([0, 120, 70], [10, 255, 255]),
+            "Vermelho2": ([170, 120, 70], [180, 255, 255]),
+            "Azul": ([100, 150, 50], [130, 255, 255]),
+            "Amarelo": ([20, 100, 100], [35, 255, 255]),
+            "Verde": ([35, 50, 50], [85, 255, 255]),
+            "Laranja": ([10, 100, 100], [20, 255, 255]),
+            "Roxo": ([130, 50, 50], [160, 255, 255])
+        }
+        
+        self.min_area = 400
+        self._kernel = np.ones((KERNEL_PADRAO, KERNEL_PADRAO), np.uint8)
+        self._limites = [
+            (color_name.replace("2", ""), np.array(lower), np.array(upper))
+            for color_name, (lower, upper) in self.colors.items()
+        ]
+    
+    def detectar_objetos(self, frame):
+        """Detecta peças LEGO sem desenhar no frame
+        
+        Returns:
+            tuple: (frame redimensionado, lista de detecções). Cada detecção
+            é um dict com 'cor', 'centro' (x, y), 'raio' e 'area', em
+            coordenadas do frame retornado.
+        """
+        frame = self.redimensionar(frame)
+        blurred = cv2.GaussianBlur(frame, (5, 5), 0)
+        hsv = cv2.cvtColor(blurred, cv2.COLOR_BGR2HSV)
+        
+        deteccoes = [
+            {"cor": cor, "centro": (int(x), int(y)), "raio": int(radius), "area": area}
+            for cor, x, y, radius, area in self._segmentar(hsv)
+        ]
+        
+        return frame, deteccoes
+    
+    @property
+    def kernel(self):
+        """Elemento estruturante da morfologia, no tamanho do perfil ativo"""
+        tamanho = self.perfil["kernel"] if self.perfil is not None else self.tamanho_kernel
+        if self._kernel.shape[0] != tamanho:
+            self._kernel = np.ones((tamanho, tamanho), np.uint8)
+        return self._kernel
+    
+    def _segmentar(self, hsv):
+        """Gera (cor, x, y, raio, área) de cada região de cor da imagem HSV"""
+        kernel = self.kernel
+        for cor, lower, upper in self._limites:
+            mask = cv2.inRange(hsv, lower, upper)
+            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+            
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            
+            for cnt in contours:
+                area = cv2.contourArea(cnt)
+                if area > self.min_area:
+                    (x, y), radius = cv2.minEnclosingCircle(cnt)
+                    yield cor, x, y, radius, area
+    
+    def redimensionar(self, frame):
+        """Reduz o frame para a largura de detecção do perfil, se for maior"""
+        if self.perfil is None:
+            return frame
+        height, width = frame.shape[:2]
+        largura = self.perfil["largura_deteccao"]
+        if width > largura:
+            scale = largura / width
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return frame
+    
+    @staticmethod
+    def desenhar_deteccoes(frame, deteccoes):
+        """Desenha círculo e nome da cor de cada detecção no frame"""
+        for deteccao in deteccoes:
+            center = deteccao["centro"]
+            radius = deteccao["raio"]
+            cv2.circle(frame, center, radius, (0, 255, 0), 2)
+            cv2.putText(frame, deteccao["cor"], 
+                      (center[0] - 30, center[1] - radius - 10),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        return frame
+    
+    def detect(self, frame):
+        """Detecta cores LEGO no frame"""
+        frame, deteccoes = self.detectar_objetos(frame)
+        self.desenhar_deteccoes(frame, deteccoes)
+        return frame, [f"Cor:{deteccao['cor']}" for deteccao in deteccoes]
+
+# ==============================
+# PROTOCOLO DA DETECÇÃO REMOTA
+# ==============================
+def codificar_pedido(kernel, jpeg):
+    """Conteúdo de um pedido: tamanho do kernel do perfil e o JPEG do quadro"""
+    return struct.pack(">B", kernel) + jpeg
+
+def decodificar_pedido(dados):
+    """
+    Returns:
+        tuple: (tamanho do kernel, bytes do JPEG)
+    """
+    return dados[0], dados[1:]
+
+def enviar_mensagem_deteccao(sock, seq, dados):
+    """Envia uma mensagem do protocolo de detecção: tamanho, seq e conteúdo"""
+    sock.sendall(struct.pack(">IQ", len(dados), seq) + dados)
+
+def receber_mensagem_deteccao(sock):
+    """Recebe uma mensagem do protocolo de detecção
+    
+    Returns:
+        tuple: (seq, bytes do conteúdo)
+    """
+    tamanho, seq = struct.unpack(">IQ", _receber_exato(sock, 12))
+    return seq, _receber_exato(sock, tamanho)
+
+def _receber_exato(sock, tamanho):
+    dados = bytearray()
+    while len(dados) < tamanho:
+        parte = sock.recv(tamanho - len(dados))
+        if not parte:
+            raise ConnectionError("Conexão encerrada pelo outro lado")
+        dados.extend(parte)
+    return bytes(dados)
@@ -1,15 +1,40 @@
+import atexit
 import cv2
-import numpy as np
 import socket
 import ssl
 import threading
 import time
-from flask import Flask, Response, jsonify
+from flask import Flask, Response, jsonify, request, send_from_directory
 from flask_cors import CORS
 import paho.mqtt.client as mqtt
+import hashlib
+import heapq
+import itertools
 import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import shutil
+import sqlite3
+import struct
+import subprocess
+import sys
+import tempfile
+import urllib.request
+from array import array
+from collections import OrderedDict, deque
+from types import MappingProxyType
 from datetime import datetime
 
+from deteccao import (
+    LegoColorDetector,
+    codificar_pedido,
+    enviar_mensagem_deteccao,
+    receber_mensagem_deteccao,
+)
+
 # ==============================
 # CONFIGURAÇÕES
 # ==============================
@@ -17,49 +42,739 @@ MQTT_BROKER = "f36a296472af4ff7bc783d027dcf8cb2.s1.eu.hivemq.cloud"
 MQTT_PORT = 8883
 MQTT_USER = "yago_ic"
 MQTT_PASSWORD = "brokerP&x+e[5&ifZ_R}T"
+
+# Broker local (mosquitto ou compatível na rede da esteira). Com ele
+# definido, o servidor publica e recebe só pelo broker local e a
+# PonteMQTT encaminha para a nuvem apenas os tópicos abaixo.
+MQTT_LOCAL_BROKER = os.environ.get("MQTT_LOCAL_BROKER")  # ex.: "localhost"
+MQTT_LOCAL_PORT = int(os.environ.get("MQTT_LOCAL_PORT", 1883))
+MQTT_LOCAL_USER = os.environ.get("MQTT_LOCAL_USER")
+MQTT_LOCAL_PASSWORD = os.environ.get("MQTT_LOCAL_PASSWORD")
 MQTT_TOPIC = "dados/camera"
 SOLICITAR_IP_TOPIC = "dados/solicitar_ip"
 APP_CONTROL_TOPIC = "dados/app"
+NGROK_TOPIC = "ngrok/ip"
+# Tópicos por câmera; MQTT_TOPIC continua recebendo as cores de todas
+TOPICO_CAMERA = MQTT_TOPIC + "/{camera}"
+RASTREIO_TOPIC = MQTT_TOPIC + "/{camera}/rastreio"
+LATENCIA_APP_TOPIC = "dados/app/latencia"
+RESUMO_TOPIC = "dados/resumo"
+
+# Telemetria binária versionada, um tópico por tipo de mensagem
+TELEMETRIA_VERSAO = 1
+TELEMETRIA_DETECCAO_TOPIC = "dados/bin/deteccao"
+TELEMETRIA_STATUS_TOPIC = "dados/bin/status"
+TELEMETRIA_DESCOBERTA_TOPIC = "dados/bin/descoberta"
+# Mantém as mensagens de texto em MQTT_TOPIC enquanto o app não migrar
+TELEMETRIA_TEXTO_LEGADO = True
+
+# Ponte broker local <-> nuvem (os filtros dos dois sentidos não podem se sobrepor)
+PONTE_PARA_NUVEM = [MQTT_TOPIC, MQTT_TOPIC + "/#", "dados/bin/#", RESUMO_TOPIC, NGROK_TOPIC]
+PONTE_DA_NUVEM = [APP_CONTROL_TOPIC, SOLICITAR_IP_TOPIC, LATENCIA_APP_TOPIC]
+# O broker limpa o RETAIN nas entregas ao vivo (MQTT 3.1.1): estes sobem retidos
+PONTE_RETIDOS = [TELEMETRIA_STATUS_TOPIC, TELEMETRIA_DESCOBERTA_TOPIC, NGROK_TOPIC]
+# Sem a nuvem, o resto sobe pela fila offline, exceto o que perde valor com o atraso
+PONTE_SEM_FILA = [RASTREIO_TOPIC.format(camera="+"), RESUMO_TOPIC]
+NGROK_API_URL = "http://localhost:4040/api/tunnels"
+
+# Perfis de desempenho (ver GerenciadorPerfis): Pi 3, Pi 4 e PC
+PERFIS_DESEMPENHO = {
+    "low-power": {
+        "largura": 320, "altura": 240, "fps": 10, "largura_deteccao": 320, "kernel": 3,
+        "jpeg_stream": 70, "jpeg_captura": 85, "intervalo_mqtt": 1.0, "hls_bitrate": "200k",
+    },
+    "balanced": {
+        "largura": 640, "altura": 480, "fps": 15, "largura_deteccao": 640, "kernel": 5,
+        "jpeg_stream": 85, "jpeg_captura": 95, "intervalo_mqtt": 0.5, "hls_bitrate": "400k",
+    },
+    "max-throughput": {
+        "largura": 1280, "altura": 720, "fps": 30, "largura_deteccao": 640, "kernel": 5,
+        "jpeg_stream": 85, "jpeg_captura": 95, "intervalo_mqtt": 0.2, "hls_bitrate": "1500k",
+    },
+}
+PERFIL_PADRAO = "balanced"
+PERFIL_ARQUIVO = "perfil.json"
+PERFIL_VARIAVEL_AMBIENTE = "ESTEIRA_PERFIL"
+
+# Câmeras: None usa todas as detectadas; ou lista de índices/dispositivos
+CAMERAS_DISPOSITIVOS = None
+# Pede MJPEG às câmeras USB e recebe o JPEG sem decodificar (backend V4L2)
+CAPTURA_MJPEG = True
+
+# Watchdog da captura: sem frame bom por esse tempo, reabre/redescobre a câmera
+CAPTURA_IDADE_MAXIMA_S = 3.0
+CAPTURA_BACKOFF_INICIAL_S = 0.5
+CAPTURA_BACKOFF_MAXIMO_S = 10.0
+DETECCAO_WORKERS = 2
+
+# Detecção remota (worker_deteccao.py em outro computador da rede local)
+DETECCAO_REMOTA_WORKERS = []  # ex.: ["192.168.0.20:5600"]; vazio usa só a detecção local
+DETECCAO_REMOTA_TIMEOUT_S = 0.2
+DETECCAO_REMOTA_RECONEXAO_S = 5
+DETECCAO_REMOTA_JPEG_QUALIDADE = 80
+
+# Long-poll de quadros (/camera_ia/capture?after=<seq>)
+QUADROS_RECENTES = 8
+LONGPOLL_TIMEOUT_PADRAO = 10
+LONGPOLL_TIMEOUT_MAXIMO = 30
+REDE_INTERVALO_VERIFICACAO = 5
+
+# Reconexão MQTT e fila offline
+MQTT_BACKOFF_INICIAL = 1.0
+MQTT_BACKOFF_MAXIMO = 60.0
+OUTBOX_ARQUIVO = "outbox_mqtt.db"
+OUTBOX_PONTE_ARQUIVO = "outbox_ponte.db"
+OUTBOX_MAX_MENSAGENS = 5000
+OUTBOX_TAXA_ENVIO = 20
+OUTBOX_JANELA = 20  # mensagens QoS 1 em voo por lote ao drenar a fila
+MQTT_FILA_MENSAGENS = 100
+
+# Display LCD
+LCD_COLUNAS = 16
+LCD_LINHAS = 2
+LCD_TAXA_MAXIMA_HZ = 4
+
+# Ejetores de separação (posição medida a partir do centro do quadro, no sentido da esteira)
+VELOCIDADE_ESTEIRA_M_S = 0.10
+# Largura da esteira vista pela câmera, em metros. A posição da peça é
+# calculada pela fração da largura do quadro, então vale para qualquer
+# resolução ou perfil de desempenho
+CAMPO_VISAO_M = 0.32
+DIRECAO_ESTEIRA = 1
+EJETORES = {
+    "Vermelho": {"pino": 17, "distancia_m": 0.30},
+    "Azul": {"pino": 27, "distancia_m": 0.45},
+    "Verde": {"pino": 22, "distancia_m": 0.60},
+}
+PULSO_EJETOR_S = 0.08
+JANELA_MESMA_PECA_S = 0.25
+
+# Medição de latência
+LATENCIA_AMOSTRAS = 1000
+
+# Stream H.264 / HLS (requer ffmpeg com libx264)
+HLS_DIRETORIO = os.path.join(tempfile.gettempdir(), "esteira_hls")
+HLS_DURACAO_SEGMENTO = 1
+HLS_SEGMENTOS_PLAYLIST = 6
+HLS_TIMEOUT_OCIOSO_S = 30
+
+# Recortes das peças detectadas (/detections/<id>.jpg)
+RECORTES_DIRETORIO = "recortes"
+RECORTES_TAMANHO_MAXIMO = 50 * 1024 * 1024
+RECORTES_JPEG_QUALIDADE = 80
+RECORTES_MARGEM = 1.3
+RECORTES_FILA = 32
+
+# Taxa de peças por cor em janelas deslizantes (RESUMO_TOPIC)
+TAXAS_JANELAS_S = {"1m": 60, "5m": 300, "15m": 900}
+TAXAS_BALDE_S = 10
+TAXAS_INTERVALO_PUBLICACAO_S = 10
 
-# Configurações de performance
-RESOLUTION_WIDTH = 640
-RESOLUTION_HEIGHT = 480
-FPS_TARGET = 15
-MQTT_SEND_INTERVAL = 0.5
+# Logs: nível, formato ("texto" ou "json") e limite de repetição por evento
+LOG_NIVEL = os.environ.get("LOG_NIVEL", "INFO")
+LOG_FORMATO = os.environ.get("LOG_FORMATO", "texto")
+LOG_LIMITE_POR_EVENTO = 5
+LOG_JANELA_LIMITE_S = 10
+
+# Feed local de eventos (/events)
+EVENTOS_HISTORICO = 500
+EVENTOS_KEEPALIVE_S = 15
 
 cores_e_data = "dados.json"
 
+# Cores com contador pré-alocado no estado do sistema
+CORES_CONHECIDAS = ("Vermelho", "Azul", "Amarelo", "Verde", "Laranja", "Roxo")
+
+# ==============================
+# LOGS
+# ==============================
+class FormatadorEstruturado(logging.Formatter):
+    """Formata registros em texto ou JSON, com os campos de extra={"campos": {...}}"""
+    def __init__(self, formato=LOG_FORMATO):
+        super().__init__()
+        self.formato = formato
+    
+    def format(self, record):
+        subsistema = record.name.rpartition(".")[2].upper()
+        campos = dict(getattr(record, "campos", None) or {})
+        if getattr(record, "suprimidas", 0):
+            campos["suprimidas"] = record.suprimidas
+        
+        if self.formato == "json":
+            registro = {"t": round(record.created, 3), "nivel": record.levelname,
+                        "sub": subsistema, "msg": record.getMessage()}
+            registro.update(campos)
+            if record.exc_info:
+                registro["exc"] = self.formatException(record.exc_info)
+            return json.dumps(registro, ensure_ascii=False, default=str)
+        
+        linha = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} [{subsistema}] {record.getMessage()}"
+        if campos:
+            linha += " " + " ".join(f"{chave}={valor}" for chave, valor in campos.items())
+        if record.exc_info:
+            linha += "\n" + self.formatException(record.exc_info)
+        return linha
+
+class LimitadorLog(logging.Filter):
+    """Limita cada evento (logger + mensagem sem argumentos) a
+    LOG_LIMITE_POR_EVENTO registros a cada LOG_JANELA_LIMITE_S segundos
+    
+    Eventos podem ser separados com extra={"chave_limite": ...} (ex.: por
+    câmera). O primeiro registro após a janela informa quantos foram
+    suprimidos.
+    """
+    def __init__(self, limite=LOG_LIMITE_POR_EVENTO, janela_s=LOG_JANELA_LIMITE_S):
+        super().__init__()
+        self.limite = limite
+        self.janela_s = janela_s
+        self._eventos = {}
+        self._lock = threading.Lock()
+    
+    def filter(self, record):
+        chave = (record.name, record.msg, getattr(record, "chave_limite", None))
+        agora = time.monotonic()
+        with self._lock:
+            inicio, quantidade, suprimidas = self._eventos.get(chave, (agora, 0, 0))
+            if agora - inicio >= self.janela_s:
+                inicio, quantidade = agora, 0
+            if quantidade >= self.limite:
+                self._eventos[chave] = (inicio, quantidade, suprimidas + 1)
+                return False
+            self._eventos[chave] = (inicio, quantidade + 1, 0)
+        record.suprimidas = suprimidas
+        return True
+
+def configurar_logs(nivel=LOG_NIVEL):
+    """Envia os logs por uma fila para uma thread que escreve no console
+    
+    Quem registra só formata a mensagem e enfileira; a escrita no console
+    (muitas vezes o journal no cartão SD) fica fora das threads de captura
+    e MQTT.
+    """
+    raiz = logging.getLogger("esteira")
+    if raiz.handlers:
+        return
+    fila = queue.SimpleQueue()
+    handler_fila = logging.handlers.QueueHandler(fila)
+    handler_fila.addFilter(LimitadorLog())
+    raiz.addHandler(handler_fila)
+    raiz.setLevel(nivel)
+    raiz.propagate = False
+    
+    saida = logging.StreamHandler(sys.stdout)
+    saida.setFormatter(FormatadorEstruturado())
+    ouvinte = logging.handlers.QueueListener(fila, saida)
+    ouvinte.start()
+    atexit.register(ouvinte.stop)
+
+def obter_logger(subsistema):
+    return logging.getLogger(f"esteira.{subsistema}")
+
+configurar_logs()
+log_estado = obter_logger("estado")
+log_taxas = obter_logger("taxas")
+log_gpio = obter_logger("gpio")
+log_atuacao = obter_logger("atuacao")
+log_lcd = obter_logger("lcd")
+log_outbox = obter_logger("outbox")
+log_mqtt = obter_logger("mqtt")
+log_ponte = obter_logger("ponte")
+log_camera = obter_logger("camera")
+log_rede = obter_logger("rede")
+log_init = obter_logger("init")
+log_deteccao = obter_logger("deteccao")
+log_recortes = obter_logger("recortes")
+log_hls = obter_logger("hls")
+log_sistema = obter_logger("sistema")
+
+# ==============================
+# PERFIS DE DESEMPENHO
+# ==============================
+class GerenciadorPerfis:
+    """Perfil de desempenho ativo: resolução, FPS, escala da detecção,
+    kernel da morfologia, qualidade JPEG e intervalo MQTT
+    
+    No boot, o perfil vem da variável ESTEIRA_PERFIL, do arquivo
+    PERFIL_ARQUIVO ou de PERFIL_PADRAO, nessa ordem. O arquivo também pode
+    ajustar valores de qualquer perfil:
+        {"perfil": "balanced", "ajustes": {"fps": 12}}
+    A troca em tempo de execução (POST /perfil) grava o arquivo. Os
+    valores são um snapshot imutável trocado com uma única atribuição.
+    """
+    def __init__(self, perfis=PERFIS_DESEMPENHO, arquivo=PERFIL_ARQUIVO):
+        self.perfis = perfis
+        self.arquivo = arquivo
+        self.nome = None
+        self.origem = None
+        self.valores = None
+        self._ajustes = {}
+        self._carregar()
+    
+    def __getitem__(self, chave):
+        return self.valores[chave]
+    
+    def _carregar(self):
+        config = {}
+        try:
+            with open(self.arquivo) as arquivo:
+                config = json.load(arquivo)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            log_sistema.warning("Arquivo de perfil inválido (%s): %s", self.arquivo, e)
+        self._ajustes = config.get("ajustes", {})
+        
+        for nome, origem in ((os.environ.get(PERFIL_VARIAVEL_AMBIENTE), "ambiente"),
+                             (config.get("perfil"), "arquivo")):
+            if not nome:
+                continue
+            try:
+                self._aplicar(nome, origem)
+                return
+            except ValueError as e:
+                log_sistema.warning("%s", e)
+        self._aplicar(PERFIL_PADRAO, "padrao")
+    
+    def _aplicar(self, nome, origem):
+        if nome not in self.perfis:
+            raise ValueError(f"Perfil desconhecido: {nome}")
+        valores = dict(self.perfis[nome])
+        valores.update({chave: valor for chave, valor in self._ajustes.items() if chave in valores})
+        self.valores = MappingProxyType(valores)
+        self.nome = nome
+        self.origem = origem
+        log_sistema.info("Perfil de desempenho: %s (%s)", nome, origem)
+    
+    def selecionar(self, nome):
+        """Troca o perfil em tempo de execução e grava a escolha no arquivo
+        
+        Raises:
+            ValueError: perfil desconhecido
+        """
+        self._aplicar(nome, "api")
+        try:
+            with open(self.arquivo, "w") as arquivo:
+                json.dump({"perfil": nome, "ajustes": self._ajustes}, arquivo, indent=2)
+        except OSError as e:
+            log_sistema.warning("Não foi possível gravar %s: %s", self.arquivo, e)
+    
+    def get_status(self):
+        return {
+            "ativo": self.nome,
+            "origem": self.origem,
+            "valores": dict(self.valores),
+            "disponiveis": list(self.perfis)
+        }
+
+perfis = GerenciadorPerfis()
+
+# ==============================
+# BARRAMENTO DE EVENTOS LOCAIS
+# ==============================
+class BarramentoEventos:
+    """Eventos numerados em sequência, com histórico para retomada
+    
+    Os ids têm o formato '<instância>:<seq>'; a instância muda a cada
+    inicialização do servidor para que um cliente com id antigo não fique
+    esperando uma sequência que recomeçou do zero.
+    """
+    def __init__(self, tamanho_historico=EVENTOS_HISTORICO):
+        self.instancia = format(int(time.time()), 'x')
+        self._historico = deque(maxlen=tamanho_historico)
+        self._cond = threading.Condition()
+        self._seq = 0
+    
+    def publicar(self, tipo, dados):
+        """Registra evento e acorda os clientes conectados"""
+        conteudo = json.dumps(dados)
+        with self._cond:
+            self._seq += 1
+            self._historico.append((self._seq, tipo, conteudo))
+            self._cond.notify_all()
+            return self._seq
+    
+    def interpretar_id(self, ultimo_id):
+        """Converte o Last-Event-ID do cliente na última seq já recebida"""
+        if not ultimo_id:
+            return self._seq
+        instancia, _, seq = str(ultimo_id).rpartition(":")
+        if instancia != self.instancia or not seq.isdigit():
+            return 0
+        return int(seq)
+    
+    def formatar_id(self, seq):
+        return f"{self.instancia}:{seq}"
+    
+    def aguardar(self, apos_seq, timeout):
+        """Retorna eventos com seq > apos_seq, aguardando até timeout se não houver"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > apos_seq, timeout)
+            novos = min(self._seq - apos_seq, len(self._historico))
+            if novos <= 0:
+                return []
+            return list(itertools.islice(self._historico, len(self._historico) - novos, None))
+
 # ==============================
 # CONTROLE DE ESTADO GLOBAL
 # ==============================
 class SystemState:
-    """Armazena estado do sistema"""
-    def __init__(self):
-        self.esteira_ligada = False
-        self.cores_detectadas = []
-        self.ultima_cor_detectada = None
-        self.timestamp_ultima_deteccao = None
-        self.ultimo_frame = None
+    """Armazena estado do sistema
+    
+    As escritas são serializadas por um lock e, ao final de cada uma, um
+    snapshot imutável é publicado com uma única atribuição. Leitores usam
+    o snapshot sem lock e nunca veem um estado parcialmente atualizado.
+    """
+    def __init__(self, cores=CORES_CONHECIDAS, barramento_eventos=None):
+        self._lock = threading.Lock()
+        self.barramento_eventos = barramento_eventos
+        self._indice_cor = {cor: i for i, cor in enumerate(cores)}
+        self._nomes_cores = list(cores)
+        self._contagens = array('Q', [0] * len(cores))
+        self._ordem_deteccao = []
+        self._esteira_ligada = False
+        self._ultima_cor = None
+        self._timestamp_ultima_deteccao = None
+        self._snapshot = self._montar_snapshot()
+    
+    @property
+    def esteira_ligada(self):
+        return self._snapshot["esteira_ligada"]
+    
+    @property
+    def cores_detectadas(self):
+        return self._snapshot["cores_detectadas"]
+    
+    @property
+    def ultima_cor_detectada(self):
+        return self._snapshot["ultima_cor"]
+    
+    @property
+    def timestamp_ultima_deteccao(self):
+        return self._snapshot["timestamp"]
         
     def atualizar_esteira(self, estado):
         """Atualiza estado da esteira (0 ou 1)"""
-        self.esteira_ligada = bool(int(estado))
-        print(f"[ESTADO] Esteira: {'LIGADA' if self.esteira_ligada else 'DESLIGADA'}")
+        with self._lock:
+            self._esteira_ligada = bool(int(estado))
+            self._snapshot = self._montar_snapshot()
+        log_estado.info("Esteira: %s", "LIGADA" if self._esteira_ligada else "DESLIGADA")
+        if self.barramento_eventos:
+            self.barramento_eventos.publicar("esteira", {
+                "esteira_ligada": self.esteira_ligada,
+                "timestamp": time.time()
+            })
         
     def adicionar_cor(self, cor):
-        """Adiciona cor detectada ao histórico"""
-        if cor not in self.cores_detectadas:
-            self.cores_detectadas.append(cor)
-        self.ultima_cor_detectada = cor
-        # self.timestamp_ultima_deteccao = time.time()
-        self.timestamp_ultima_deteccao =  datetime.now()
+        """Adiciona cor detectada ao histórico (O(1))"""
+        with self._lock:
+            indice = self._indice_cor.get(cor)
+            if indice is None:
+                # Cor fora da lista pré-alocada ganha um novo slot
+                indice = len(self._nomes_cores)
+                self._indice_cor[cor] = indice
+                self._nomes_cores.append(cor)
+                self._contagens.append(0)
+            if self._contagens[indice] == 0:
+                self._ordem_deteccao.append(cor)
+            self._contagens[indice] += 1
+            self._ultima_cor = cor
+            self._timestamp_ultima_deteccao = datetime.now()
+            self._snapshot = self._montar_snapshot()
+    
+    def _montar_snapshot(self):
+        """Monta snapshot imutável do estado (chamado com o lock adquirido)"""
+        return MappingProxyType({
+            "esteira_ligada": self._esteira_ligada,
+            "cores_detectadas": tuple(self._ordem_deteccao),
+            "contagens": MappingProxyType({cor: self._contagens[self._indice_cor[cor]]
+                                           for cor in self._ordem_deteccao}),
+            "ultima_cor": self._ultima_cor,
+            "timestamp": self._timestamp_ultima_deteccao.isoformat()
+                         if self._timestamp_ultima_deteccao else None
+        })
+    
     def get_status(self):
-        """Retorna status completo do sistema"""
+        """Retorna status completo do sistema (cópia serializável do snapshot)"""
+        snapshot = self._snapshot
+        status = dict(snapshot)
+        status["cores_detectadas"] = list(snapshot["cores_detectadas"])
+        status["contagens"] = dict(snapshot["contagens"])
+        return status
+
+# ==============================
+# TAXAS DE PEÇAS
+# ==============================
+class TaxasPecas:
+    """Peças por minuto de cada cor em janelas deslizantes (1, 5 e 15 min)
+    
+    As contagens ficam em baldes de TAXAS_BALDE_S segundos num buffer
+    circular por cor, então registrar é O(1) e a memória é fixa. O resumo
+    é publicado em RESUMO_TOPIC a cada TAXAS_INTERVALO_PUBLICACAO_S.
+    
+    As câmeras informam cada detecção e a mesma peça vista em vários
+    quadros seguidos é contada uma única vez (registrar_deteccao).
+    """
+    def __init__(self, janelas=TAXAS_JANELAS_S, balde_s=TAXAS_BALDE_S, velocidade=VELOCIDADE_ESTEIRA_M_S):
+        self.janelas = janelas
+        self.balde_s = balde_s
+        self.velocidade = velocidade
+        self._passagens = PassagensRecentes()
+        self.num_baldes = max(janelas.values()) // balde_s
+        self._baldes = {}
+        self._balde_atual = self._indice_balde(time.monotonic())
+        self._inicio = time.monotonic()
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+    
+    def _indice_balde(self, agora):
+        return int(agora // self.balde_s)
+    
+    def _avancar(self, agora):
+        """Zera os baldes que ficaram para trás desde a última atualização"""
+        indice = self._indice_balde(agora)
+        for pular in range(self._balde_atual + 1, min(indice, self._balde_atual + self.num_baldes) + 1):
+            posicao = pular % self.num_baldes
+            for baldes in self._baldes.values():
+                baldes[posicao] = 0
+        self._balde_atual = max(self._balde_atual, indice)
+    
+    def registrar(self, cor):
+        """Conta uma peça da cor no balde atual"""
+        with self._lock:
+            self._avancar(time.monotonic())
+            baldes = self._baldes.get(cor)
+            if baldes is None:
+                baldes = self._baldes[cor] = array('I', [0] * self.num_baldes)
+            baldes[self._balde_atual % self.num_baldes] += 1
+    
+    def registrar_deteccao(self, camera, cor, posicao_m, t_captura):
+        """Conta a peça detectada se ela ainda não foi contada
+        
+        Com a esteira andando, a mesma peça passa pelo centro do quadro no
+        mesmo instante em todos os quadros em que aparece, e
+        PassagensRecentes reconhece a repetição; duas peças da mesma cor no
+        mesmo quadro contam duas vezes.
+        
+        Args:
+            camera (str): Nome da câmera
+            cor (str): Cor detectada
+            posicao_m (float): Posição da peça a partir do centro do quadro
+            t_captura (float): time.monotonic() do momento da captura
+        
+        Returns:
+            bool: True se a peça foi contada
+        """
+        passagem = t_captura - posicao_m / self.velocidade
+        with self._lock:
+            if not self._passagens.nova((camera, cor), passagem):
+                return False
+        self.registrar(cor)
+        return True
+    
+    def resumo(self):
+        """Peças por minuto por cor e no total, para cada janela"""
+        agora = time.monotonic()
+        with self._lock:
+            self._avancar(agora)
+            resumo = {}
+            for nome, segundos in self.janelas.items():
+                quantidade = segundos // self.balde_s
+                posicoes = [(self._balde_atual - i) % self.num_baldes for i in range(quantidade)]
+                # Logo após o boot a janela ainda não está completa
+                minutos = max(min(segundos, agora - self._inicio), self.balde_s) / 60
+                taxas = {cor: round(sum(baldes[p] for p in posicoes) / minutos, 2)
+                         for cor, baldes in self._baldes.items()}
+                taxas = {cor: taxa for cor, taxa in taxas.items() if taxa}
+                taxas["total"] = round(sum(taxas.values()), 2)
+                resumo[nome] = taxas
+        return resumo
+    
+    def iniciar(self, mqtt_handler, intervalo=TAXAS_INTERVALO_PUBLICACAO_S):
+        """Inicia a publicação periódica do resumo"""
+        self._thread = threading.Thread(target=self._loop, args=(mqtt_handler, intervalo),
+                                        name="taxas", daemon=True)
+        self._thread.start()
+    
+    def _loop(self, mqtt_handler, intervalo):
+        while not self._parar.wait(intervalo):
+            try:
+                resumo = {"t": round(time.time(), 1), "pecas_por_minuto": self.resumo()}
+                # Resumo antigo não tem valor: não vai para a fila offline
+                mqtt_handler.publicar(RESUMO_TOPIC, json.dumps(resumo, separators=(",", ":")),
+                                      qos=0, persistir=False)
+            except Exception as e:
+                log_taxas.error("Erro ao publicar resumo: %s", e)
+    
+    def parar(self):
+        self._parar.set()
+
+# ==============================
+# TELEMETRIA BINÁRIA
+# ==============================
+# Formato v1 (big-endian). Todas as mensagens começam com versão (B) e tipo (B).
+#   deteccao:   seq (I), t_captura em ms (Q), câmera (texto B), n (B),
+#               n x [cor (B), x (H), y (H), raio (H)]
+#   status:     flags (B, bit 0 = esteira ligada), n (B), n x [cor (B), contagem (I)]
+#   descoberta: ip, url_local e url_tunel (texto H)
+# Cores são índices de CORES_CONHECIDAS; COR_DESCONHECIDA para as demais.
+# Decodificador de referência do app: esteira-admin/hooks/telemetria.ts
+TIPO_DETECCAO = 1
+TIPO_STATUS = 2
+TIPO_DESCOBERTA = 3
+COR_DESCONHECIDA = 0xFF
+
+def _codificar_texto(texto, formato_tamanho=">B"):
+    dados = (texto or "").encode("utf-8")
+    return struct.pack(formato_tamanho, len(dados)) + dados
+
+def _decodificar_texto(payload, posicao, formato_tamanho=">B"):
+    tamanho, = struct.unpack_from(formato_tamanho, payload, posicao)
+    posicao += struct.calcsize(formato_tamanho)
+    return payload[posicao:posicao + tamanho].decode("utf-8"), posicao + tamanho
+
+def _codigo_cor(cor):
+    return CORES_CONHECIDAS.index(cor) if cor in CORES_CONHECIDAS else COR_DESCONHECIDA
+
+def codificar_deteccao(seq, t_captura, camera, deteccoes):
+    """Mensagem binária de detecção (t_captura em segundos desde a época)"""
+    partes = [
+        struct.pack(">BBIQ", TELEMETRIA_VERSAO, TIPO_DETECCAO, seq, int(t_captura * 1000)),
+        _codificar_texto(camera),
+        struct.pack(">B", min(len(deteccoes), 255)),
+    ]
+    for deteccao in deteccoes[:255]:
+        x, y = deteccao["centro"]
+        partes.append(struct.pack(">BHHH", _codigo_cor(deteccao["cor"]), x, y, deteccao["raio"]))
+    return b"".join(partes)
+
+def codificar_status(esteira_ligada, contagens):
+    """Mensagem binária de status com as contagens por cor"""
+    itens = [(_codigo_cor(cor), quantidade) for cor, quantidade in contagens.items()
+             if cor in CORES_CONHECIDAS]
+    partes = [struct.pack(">BBBB", TELEMETRIA_VERSAO, TIPO_STATUS, int(bool(esteira_ligada)), len(itens))]
+    partes.extend(struct.pack(">BI", codigo, min(quantidade, 0xFFFFFFFF)) for codigo, quantidade in itens)
+    return b"".join(partes)
+
+def codificar_descoberta(ip, url_local, url_tunel):
+    """Mensagem binária com os endereços do servidor"""
+    return (struct.pack(">BB", TELEMETRIA_VERSAO, TIPO_DESCOBERTA)
+            + b"".join(_codificar_texto(texto, ">H") for texto in (ip, url_local, url_tunel)))
+
+def decodificar_telemetria(payload):
+    """Decodifica qualquer mensagem binária v1 para um dict
+    
+    Raises:
+        ValueError: versão ou tipo desconhecido
+    """
+    versao, tipo = struct.unpack_from(">BB", payload, 0)
+    if versao != TELEMETRIA_VERSAO:
+        raise ValueError(f"Versão de telemetria não suportada: {versao}")
+    
+    def nome_cor(codigo):
+        return CORES_CONHECIDAS[codigo] if codigo < len(CORES_CONHECIDAS) else None
+    
+    if tipo == TIPO_DETECCAO:
+        seq, t_captura_ms = struct.unpack_from(">IQ", payload, 2)
+        camera, posicao = _decodificar_texto(payload, 14)
+        quantidade, = struct.unpack_from(">B", payload, posicao)
+        deteccoes = []
+        for i in range(quantidade):
+            codigo, x, y, raio = struct.unpack_from(">BHHH", payload, posicao + 1 + i * 7)
+            deteccoes.append({"cor": nome_cor(codigo), "centro": (x, y), "raio": raio})
+        return {"tipo": "deteccao", "seq": seq, "t_captura": t_captura_ms / 1000,
+                "camera": camera, "deteccoes": deteccoes}
+    
+    if tipo == TIPO_STATUS:
+        flags, quantidade = struct.unpack_from(">BB", payload, 2)
+        contagens = {}
+        for i in range(quantidade):
+            codigo, contagem = struct.unpack_from(">BI", payload, 4 + i * 5)
+            contagens[nome_cor(codigo)] = contagem
+        return {"tipo": "status", "esteira_ligada": bool(flags & 1), "contagens": contagens}
+    
+    if tipo == TIPO_DESCOBERTA:
+        posicao = 2
+        textos = []
+        for _ in range(3):
+            texto, posicao = _decodificar_texto(payload, posicao, ">H")
+            textos.append(texto or None)
+        ip, url_local, url_tunel = textos
+        return {"tipo": "descoberta", "ip": ip, "url_local": url_local, "url_tunel": url_tunel}
+    
+    raise ValueError(f"Tipo de telemetria desconhecido: {tipo}")
+
+# ==============================
+# MEDIÇÃO DE LATÊNCIA
+# ==============================
+def percentil(valores_ordenados, p):
+    """Percentil p (0-100) de uma lista já ordenada"""
+    if not valores_ordenados:
+        return None
+    indice = round(p / 100 * (len(valores_ordenados) - 1))
+    return valores_ordenados[indice]
+
+class QuadroCapturado:
+    """Frame capturado com número de sequência e tempos de cada etapa
+    
+    Com captura MJPEG, jpeg_camera guarda os bytes originais da câmera,
+    repassados sem recodificar para quem pede o vídeo sem anotações.
+    """
+    def __init__(self, seq, imagem, t_captura, jpeg_camera=None):
+        self.seq = seq
+        self.imagem = imagem
+        self.t_captura = t_captura
+        self.t_captura_epoch = time.time()
+        self.jpeg_camera = jpeg_camera
+        self.deteccoes = []
+        self.etapas = {}
+        self.jpeg = {}
+    
+    def marcar(self, etapa, inicio):
+        """Registra a duração de uma etapa iniciada em inicio (time.monotonic)"""
+        self.etapas[etapa] = time.monotonic() - inicio
+    
+    def metadados(self):
+        """Geometria das detecções em formato compacto: d = [[cor, x, y, raio], ...]"""
+        altura, largura = self.imagem.shape[:2]
+        return {
+            "seq": self.seq,
+            "t": round(self.t_captura_epoch, 3),
+            "w": largura,
+            "h": altura,
+            "d": [[d["cor"], d["centro"][0], d["centro"][1], d["raio"]] for d in self.deteccoes]
+        }
+
+class MedidorLatencia:
+    """Guarda as amostras recentes de latência por etapa e calcula percentis"""
+    def __init__(self, max_amostras=LATENCIA_AMOSTRAS):
+        self.max_amostras = max_amostras
+        self._amostras = {}
+        self._lock = threading.Lock()
+    
+    def registrar(self, etapa, segundos):
+        with self._lock:
+            if etapa not in self._amostras:
+                self._amostras[etapa] = deque(maxlen=self.max_amostras)
+            self._amostras[etapa].append(segundos)
+    
+    def registrar_quadro(self, quadro):
+        for etapa, segundos in quadro.etapas.items():
+            self.registrar(etapa, segundos)
+    
+    def get_resumo(self):
+        """Retorna p50/p90/p99/máximo de cada etapa em milissegundos"""
+        with self._lock:
+            amostras = {etapa: sorted(valores) for etapa, valores in self._amostras.items()}
         return {
-            "esteira_ligada": self.esteira_ligada,
-            "cores_detectadas": self.cores_detectadas,
-            "ultima_cor": self.ultima_cor_detectada,
-            "timestamp": self.timestamp_ultima_deteccao
+            etapa: {
+                "amostras": len(valores),
+                "p50_ms": round(percentil(valores, 50) * 1000, 2),
+                "p90_ms": round(percentil(valores, 90) * 1000, 2),
+                "p99_ms": round(percentil(valores, 99) * 1000, 2),
+                "max_ms": round(valores[-1] * 1000, 2),
+            }
+            for etapa, valores in amostras.items() if valores
         }
 
 # ==============================
@@ -67,27 +782,30 @@ class SystemState:
 # ==============================
 class GPIOController:
     """Controle de GPIO para Raspberry Pi"""
-    def __init__(self):
+    def __init__(self, inicializar=True):
         self.gpio_disponivel = False
         self.pinos_configurados = {}
-        self._inicializar_gpio()
+        self._GPIO = None
+        if inicializar:
+            self.inicializar()
         
-    def _inicializar_gpio(self):
+    def inicializar(self):
         """Inicializa GPIO se disponível"""
         try:
             # Descomente as linhas abaixo quando estiver no Raspberry Pi
             import RPi.GPIO as GPIO
             GPIO.setmode(GPIO.BCM)
             GPIO.setwarnings(False)
+            self._GPIO = GPIO
             self.gpio_disponivel = True
-            print("[GPIO] GPIO inicializado com sucesso")
+            log_gpio.info("GPIO inicializado com sucesso")
             
             # Temporário: modo simulação
-            print("[GPIO] Modo simulação (GPIO não disponível)")
+            log_gpio.info("Modo simulação (GPIO não disponível)")
             self.gpio_disponivel = False
             
         except Exception as e:
-            print(f"[GPIO] GPIO não disponível: {e}")
+            log_gpio.warning("GPIO não disponível: %s", e)
             self.gpio_disponivel = False
     
     def configurar_pino(self, pino, modo):
@@ -98,18 +816,17 @@ class GPIOController:
             modo (str): 'OUT' para saída, 'IN' para entrada
         """
         if not self.gpio_disponivel:
-            print(f"[GPIO] Simulação: Pino {pino} configurado como {modo}")
+            log_gpio.debug("Simulação: pino %s configurado como %s", pino, modo)
             self.pinos_configurados[pino] = modo
             return
             
-        # Descomente quando estiver no Raspberry Pi
-        import RPi.GPIO as GPIO
+        GPIO = self._GPIO
         if modo == 'OUT':
-             GPIO.setup(22, GPIO.OUT)
+             GPIO.setup(pino, GPIO.OUT)
         elif modo == 'IN':
-             GPIO.setup(22, GPIO.IN)
+             GPIO.setup(pino, GPIO.IN)
         self.pinos_configurados[pino] = modo
-        print(f"[GPIO] Pino {pino} configurado como {modo}")
+        log_gpio.info("Pino %s configurado como %s", pino, modo)
     
     def escrever_pino(self, pino, valor):
         """Escreve valor em pino de saída
@@ -120,333 +837,696 @@ class GPIOController:
         """
         
         if not self.gpio_disponivel:
-            print(f"[GPIO] Simulação: Pino {22} = {valor}")
+            log_gpio.debug("Simulação: pino %s = %s", pino, valor)
             return
             
-        # Descomente quando estiver no Raspberry Pi
-        import RPi.GPIO as GPIO
-        GPIO.output(22, GPIO.HIGH if valor else GPIO.LOW)
+        GPIO = self._GPIO
+        GPIO.output(pino, GPIO.HIGH if valor else GPIO.LOW)
     
     def ler_pino(self, pino):
         """Lê valor de pino de entrada"""
         if not self.gpio_disponivel:
             return False
             
-        # Descomente quando estiver no Raspberry Pi
-        import RPi.GPIO as GPIO
-        return GPIO.input(pino)
+        return self._GPIO.input(pino)
     
     def cleanup(self):
         """Limpa configurações GPIO"""
         if self.gpio_disponivel:
-            import RPi.GPIO as GPIO
-            GPIO.cleanup()
-            print("[GPIO] GPIO cleanup realizado")
+            self._GPIO.cleanup()
+            log_gpio.info("GPIO cleanup realizado")
+
+# ==============================
+# AGENDADOR DE ATUAÇÃO (EJETORES)
+# ==============================
+def posicao_na_esteira_m(x, largura, campo_visao_m=CAMPO_VISAO_M):
+    """Posição da peça em metros a partir do centro do quadro, no sentido da esteira"""
+    return (x / largura - 0.5) * campo_visao_m * DIRECAO_ESTEIRA
+
+class PassagensRecentes:
+    """Reconhece a mesma peça vista em vários quadros seguidos
+    
+    Cada detecção é reduzida a um instante que não muda enquanto a peça
+    atravessa o quadro (a passagem pelo centro ou a chegada ao ejetor).
+    Instantes a menos de JANELA_MESMA_PECA_S de um recente da mesma chave
+    são a mesma peça. O instante guardado é trocado pelo mais novo a cada
+    quadro, então a janela acompanha a peça mesmo quando a esteira anda
+    mais devagar ou mais depressa que VELOCIDADE_ESTEIRA_M_S.
+    
+    Não tem lock próprio; quem usa serializa as chamadas.
+    """
+    def __init__(self, janela=JANELA_MESMA_PECA_S, guardadas=8):
+        self.janela = janela
+        self.guardadas = guardadas
+        self._recentes = {}
+    
+    def nova(self, chave, instante):
+        """Registra o instante e retorna True se for de uma peça ainda não vista
+        
+        Args:
+            chave: Agrupa as peças comparadas entre si (ex.: câmera e cor)
+            instante (float): Instante de referência da peça
+        """
+        recentes = self._recentes.get(chave)
+        if recentes is None:
+            recentes = self._recentes[chave] = deque(maxlen=self.guardadas)
+        for i, anterior in enumerate(recentes):
+            if abs(instante - anterior) < self.janela:
+                recentes[i] = instante
+                return False
+        recentes.append(instante)
+        return True
+
+class AgendadorAtuacao:
+    """Aciona os ejetores no instante em que cada peça chega até eles
+    
+    O instante de chegada é calculado a partir da posição da peça no quadro,
+    do momento da captura e da velocidade da esteira. Os acionamentos ficam
+    numa fila ordenada por prazo, executada por uma thread de alta
+    prioridade que registra o atraso (jitter) de cada acionamento.
+    Funciona igualmente em modo simulação do GPIO.
+    """
+    # Margem final aguardada em espera ativa para maior precisão
+    ANTECEDENCIA_ESPERA_ATIVA = 0.002
+
+    def __init__(self, gpio_controller, ejetores=EJETORES,
+                 velocidade=VELOCIDADE_ESTEIRA_M_S, campo_visao_m=CAMPO_VISAO_M):
+        self.gpio_controller = gpio_controller
+        self.ejetores = ejetores
+        self.velocidade = velocidade
+        self.campo_visao_m = campo_visao_m
+        
+        self._fila = []
+        self._contador = itertools.count()
+        self._cond = threading.Condition()
+        self._chegadas = PassagensRecentes()
+        self._thread = None
+        
+        self.atrasos = deque(maxlen=500)
+        self.acionamentos = 0
+        self.perdidos = 0
+    
+    def iniciar(self):
+        """Configura os pinos dos ejetores e inicia a thread de temporização"""
+        for ejetor in self.ejetores.values():
+            self.gpio_controller.configurar_pino(ejetor["pino"], 'OUT')
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._executar, name="atuacao", daemon=True)
+            self._thread.start()
+    
+    def calcular_chegada(self, cor, x, largura, t_captura):
+        """Instante (time.monotonic) em que a peça chega ao ejetor da cor"""
+        ejetor = self.ejetores.get(cor)
+        if ejetor is None:
+            return None
+        posicao_m = posicao_na_esteira_m(x, largura, self.campo_visao_m)
+        return t_captura + (ejetor["distancia_m"] - posicao_m) / self.velocidade
+    
+    def agendar_deteccao(self, cor, x, largura, t_captura):
+        """Agenda o pulso do ejetor para uma peça detectada
+        
+        Args:
+            cor (str): Cor detectada
+            x (int): Coordenada x do centro da peça no quadro
+            largura (int): Largura do quadro em pixels
+            t_captura (float): time.monotonic() do momento da captura
+        
+        Returns:
+            float | None: Instante agendado, ou None se não houver ejetor,
+            se a peça já passou ou se já estava agendada
+        """
+        chegada = self.calcular_chegada(cor, x, largura, t_captura)
+        if chegada is None:
+            return None
+        
+        with self._cond:
+            if chegada <= time.monotonic():
+                self.perdidos += 1
+                return None
+            
+            # A mesma peça aparece em vários quadros seguidos
+            if not self._chegadas.nova(cor, chegada):
+                return None
+            
+            pino = self.ejetores[cor]["pino"]
+            heapq.heappush(self._fila, (chegada, next(self._contador), pino, True))
+            heapq.heappush(self._fila, (chegada + PULSO_EJETOR_S, next(self._contador), pino, False))
+            self._cond.notify()
+        return chegada
+    
+    def _aumentar_prioridade(self):
+        """Tenta colocar a thread em escalonamento de tempo real (requer root)"""
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(50))
+            log_atuacao.info("Thread de atuação em prioridade de tempo real")
+        except (AttributeError, OSError) as e:
+            log_atuacao.warning("Prioridade de tempo real indisponível: %s", e)
+    
+    def _executar(self):
+        self._aumentar_prioridade()
+        while True:
+            with self._cond:
+                while not self._fila:
+                    self._cond.wait()
+                prazo = self._fila[0][0]
+                restante = prazo - time.monotonic()
+                if restante > self.ANTECEDENCIA_ESPERA_ATIVA:
+                    # Pode acordar antes se um prazo mais cedo for agendado
+                    self._cond.wait(restante - self.ANTECEDENCIA_ESPERA_ATIVA)
+                    continue
+                _, _, pino, valor = heapq.heappop(self._fila)
+            
+            while time.monotonic() < prazo:
+                time.sleep(0)
+            
+            self.gpio_controller.escrever_pino(pino, valor)
+            self.atrasos.append(time.monotonic() - prazo)
+            if valor:
+                self.acionamentos += 1
+    
+    def get_estatisticas(self):
+        """Retorna contadores e atraso dos acionamentos em milissegundos"""
+        atrasos = sorted(self.atrasos)
+        with self._cond:
+            pendentes = len(self._fila)
+        estatisticas = {
+            "acionamentos": self.acionamentos,
+            "perdidos": self.perdidos,
+            "pendentes": pendentes,
+        }
+        if atrasos:
+            estatisticas["atraso_ms"] = {
+                "medio": round(sum(atrasos) / len(atrasos) * 1000, 3),
+                "p99": round(percentil(atrasos, 99) * 1000, 3),
+                "maximo": round(atrasos[-1] * 1000, 3),
+            }
+        return estatisticas
 
 # ==============================
 # CONTROLE LCD (PREPARADO PARA FUTURO)
 # ==============================
 class LCDController:
-    """Controle de display LCD"""
-    def __init__(self):
+    """Controle de display LCD
+    
+    As escritas no display são feitas por uma thread própria que mantém o
+    conteúdo desejado, limita a taxa de atualização e reescreve apenas os
+    caracteres que mudaram (sem clear).
+    """
+    def __init__(self, inicializar=True):
         self.lcd_disponivel = False
-        self._inicializar_lcd()
+        self._desejado = [" " * LCD_COLUNAS] * LCD_LINHAS
+        self._exibido = None
+        self._cond = threading.Condition()
+        self._thread = None
+        if inicializar:
+            self.inicializar()
         
-    def _inicializar_lcd(self):
-        """Inicializa LCD se disponível"""
+    def inicializar(self):
+        """Inicializa LCD se disponível e inicia a thread de renderização"""
         try:
             from RPLCD.i2c import CharLCD
             self.lcd = CharLCD('PCF8574', 0x27)
             self.lcd_disponivel = True
             
-            print("[LCD] LCD não configurado (preparado para implementação futura)")
+            log_lcd.info("LCD não configurado (preparado para implementação futura)")
             self.lcd_disponivel = False
             
         except Exception as e:
-            print(f"[LCD] LCD não disponível: {e}")
+            log_lcd.warning("LCD não disponível: %s", e)
             self.lcd_disponivel = False
+        
+        if self._thread is None:
+            if not self.lcd_disponivel:
+                self._exibido = [" " * LCD_COLUNAS] * LCD_LINHAS
+            self._thread = threading.Thread(target=self._renderizar, name="lcd", daemon=True)
+            self._thread.start()
     
     def exibir_mensagem(self, linha1="", linha2=""):
-        """Exibe mensagem no LCD
+        """Define mensagem do LCD (não bloqueia; a escrita ocorre na thread do LCD)
         
         Args:
             linha1 (str): Texto da primeira linha
             linha2 (str): Texto da segunda linha
         """
-        if not self.lcd_disponivel:
-            print(f"[LCD] Simulação: '{linha1}' | '{linha2}'")
-            return
-            
-        # FUTURO: Implementar exibição no LCD
-        self.lcd.clear()
-        self.lcd.write_string(linha1)
-        self.lcd.crlf()
-        self.lcd.write_string(linha2)
+        linhas = [linha[:LCD_COLUNAS].ljust(LCD_COLUNAS) for linha in (linha1, linha2)]
+        with self._cond:
+            if linhas != self._desejado:
+                self._desejado = linhas
+                self._cond.notify()
     
     def limpar(self):
         """Limpa display LCD"""
-        if self.lcd_disponivel:
-            self.lcd.clear()
-            pass
+        self.exibir_mensagem("", "")
     
     def atualizar_status(self, esteira_ligada, cor_detectada):
         """Atualiza LCD com status do sistema"""
         linha1 = f"Est: {'ON ' if esteira_ligada else 'OFF'}"
         linha2 = f"Cor: {cor_detectada[:12] if cor_detectada else 'Nenhuma'}"
         self.exibir_mensagem(linha1, linha2)
+    
+    def _renderizar(self):
+        """Aplica o conteúdo desejado respeitando a taxa máxima de atualização"""
+        intervalo = 1.0 / LCD_TAXA_MAXIMA_HZ
+        ultima_escrita = 0
+        while True:
+            with self._cond:
+                while self._desejado == self._exibido:
+                    self._cond.wait()
+            
+            # Atualizações que chegarem durante a espera são agrupadas
+            espera = intervalo - (time.monotonic() - ultima_escrita)
+            if espera > 0:
+                time.sleep(espera)
+            
+            with self._cond:
+                alvo = list(self._desejado)
+            try:
+                self._escrever_diferencas(alvo)
+            except Exception as e:
+                log_lcd.error("Erro ao escrever no LCD: %s", e)
+                self._exibido = None
+            ultima_escrita = time.monotonic()
+    
+    def _escrever_diferencas(self, alvo):
+        """Escreve no LCD apenas os trechos diferentes do que já está exibido"""
+        if not self.lcd_disponivel:
+            log_lcd.debug("Simulação: '%s' | '%s'", alvo[0].rstrip(), alvo[1].rstrip())
+            self._exibido = alvo
+            return
+        
+        if self._exibido is None:
+            # Conteúdo atual desconhecido: limpa uma única vez
+            self.lcd.clear()
+            self._exibido = [" " * LCD_COLUNAS] * LCD_LINHAS
+        
+        for linha, (novo, antigo) in enumerate(zip(alvo, self._exibido)):
+            for coluna, trecho in self._trechos_alterados(antigo, novo):
+                self.lcd.cursor_pos = (linha, coluna)
+                self.lcd.write_string(trecho)
+        self._exibido = alvo
+    
+    @staticmethod
+    def _trechos_alterados(antigo, novo):
+        """Retorna [(coluna, texto)] com os trechos que mudaram
+        
+        Trechos separados por um único caractere igual são unidos, pois
+        reescrever o caractere custa o mesmo que reposicionar o cursor.
+        """
+        trechos = []
+        inicio = None
+        fim = None
+        for coluna, (a, b) in enumerate(zip(antigo, novo)):
+            if a == b:
+                continue
+            if inicio is not None and coluna - fim <= 2:
+                fim = coluna
+                continue
+            if inicio is not None:
+                trechos.append((inicio, novo[inicio:fim + 1]))
+            inicio = fim = coluna
+        if inicio is not None:
+            trechos.append((inicio, novo[inicio:fim + 1]))
+        return trechos
+
+# ==============================
+# FILA OFFLINE MQTT
+# ==============================
+class OutboxMQTT:
+    """Fila em disco (SQLite) de mensagens não entregues, em ordem e com tamanho limitado"""
+    def __init__(self, caminho=OUTBOX_ARQUIVO, max_mensagens=OUTBOX_MAX_MENSAGENS):
+        self.caminho = caminho
+        self.max_mensagens = max_mensagens
+        self.descartadas = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._tamanho = 0
+
+    def _conexao(self):
+        """Abre o banco na primeira utilização"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.caminho, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # Sem fsync por INSERT: no WAL, NORMAL só arrisca as últimas mensagens numa queda de energia
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "topico TEXT NOT NULL, payload BLOB NOT NULL, "
+                "qos INTEGER NOT NULL, criado REAL NOT NULL)"
+            )
+            self._tamanho = self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+            if self._tamanho:
+                log_outbox.info("%d mensagens pendentes recuperadas do disco", self._tamanho)
+        return self._conn
+
+    def __len__(self):
+        with self._lock:
+            self._conexao()
+            return self._tamanho
+
+    def adicionar(self, topico, payload, qos):
+        """Adiciona mensagem no fim da fila, descartando as mais antigas se cheia"""
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        with self._lock:
+            conn = self._conexao()
+            conn.execute("INSERT INTO outbox (topico, payload, qos, criado) VALUES (?, ?, ?, ?)",
+                         (topico, payload, qos, time.time()))
+            self._tamanho += 1
+            excesso = self._tamanho - self.max_mensagens
+            if excesso > 0:
+                conn.execute("DELETE FROM outbox WHERE id IN "
+                             "(SELECT id FROM outbox ORDER BY id LIMIT ?)", (excesso,))
+                self._tamanho -= excesso
+                self.descartadas += excesso
+
+    def proximas(self, limite):
+        """Retorna as mensagens mais antigas (id, topico, payload, qos)"""
+        with self._lock:
+            return self._conexao().execute(
+                "SELECT id, topico, payload, qos FROM outbox ORDER BY id LIMIT ?", (limite,)
+            ).fetchall()
+
+    def drenar(self, client, conectado, intervalo=1.0 / OUTBOX_TAXA_ENVIO):
+        """Reenvia a fila em ordem e com taxa controlada
+        
+        Args:
+            client (mqtt.Client): Cliente usado no reenvio
+            conectado (callable): Consultado antes de cada lote; False interrompe
+            intervalo (float): Pausa entre publicações
+        """
+        while conectado():
+            mensagens = self.proximas(OUTBOX_JANELA)
+            if not mensagens or not self._enviar_lote(client, mensagens, intervalo):
+                break
+        
+        if len(self) == 0 and self.descartadas:
+            log_outbox.info("Fila %s esvaziada (%d mensagens descartadas por limite)",
+                            self.caminho, self.descartadas)
+            self.descartadas = 0
+    
+    def _enviar_lote(self, client, mensagens, intervalo):
+        """Envia um lote da fila e só então aguarda as confirmações
+        
+        O lote inteiro fica em voo ao mesmo tempo, então a fila drena na
+        taxa OUTBOX_TAXA_ENVIO e não a uma mensagem por RTT. Só as
+        mensagens confirmadas em sequência saem da fila; o resto é
+        reenviado no próximo lote.
+        
+        Returns:
+            bool: False se alguma entrega falhar
+        """
+        enviadas = []
+        for id_mensagem, topico, payload, qos in mensagens:
+            info = client.publish(topico, payload, qos=qos)
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                break
+            enviadas.append((id_mensagem, info))
+            time.sleep(intervalo)
+        
+        confirmadas = []
+        for id_mensagem, info in enviadas:
+            info.wait_for_publish(timeout=5)
+            if not info.is_published():
+                break
+            confirmadas.append(id_mensagem)
+        self.remover(confirmadas)
+        return len(confirmadas) == len(mensagens)
+    
+    def remover(self, ids_mensagens):
+        """Remove mensagens já entregues"""
+        with self._lock:
+            cursor = self._conexao().executemany("DELETE FROM outbox WHERE id = ?",
+                                                 [(id_mensagem,) for id_mensagem in ids_mensagens])
+            self._tamanho -= cursor.rowcount
 
 # ==============================
 # MQTT SETUP
 # ==============================
+def criar_cliente_mqtt(client_id, usuario=MQTT_USER, senha=MQTT_PASSWORD, tls=True):
+    """Cliente paho com credenciais e, para o broker da nuvem, TLS"""
+    client = mqtt.Client(client_id=client_id, clean_session=True)
+    if usuario:
+        client.username_pw_set(usuario, senha)
+    if tls:
+        client.tls_set(cert_reqs=ssl.CERT_NONE, tls_version=ssl.PROTOCOL_TLS)
+        client.tls_insecure_set(True)
+    return client
+
 class MQTTHandler:
-    def __init__(self, system_state, lcd_controller):
-        self.client = mqtt.Client(client_id="camera_python", clean_session=True)
-        self.client.username_pw_set(MQTT_USER, MQTT_PASSWORD)
-        self.client.tls_set(cert_reqs=ssl.CERT_NONE, tls_version=ssl.PROTOCOL_TLS)
-        self.client.tls_insecure_set(True)
+    def __init__(self, system_state, lcd_controller, medidor_latencia=None,
+                 broker=MQTT_BROKER, porta=MQTT_PORT, usuario=MQTT_USER, senha=MQTT_PASSWORD, tls=True):
+        self.broker = broker
+        self.porta = porta
+        self.client = criar_cliente_mqtt("camera_python", usuario, senha, tls)
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
         
         self.system_state = system_state
         self.lcd_controller = lcd_controller
-        self.last_colors = []
-        self.last_send_time = 0
+        self.medidor_latencia = medidor_latencia or MedidorLatencia()
+        self.last_colors = {}
+        self.last_send_time = {}
         self.connected = False
+        self.conexoes = 0
         self.local_ip = ""
         
+        self.outbox = OutboxMQTT()
+        self.tentativas_reconexao = 0
+        self._socket_aberto = False
+        self._parar = threading.Event()
+        self._evento_outbox = threading.Event()
+        self._threads = []
+        
+        # Mensagens recebidas são tratadas fora da thread de rede do paho
+        self._fila_mensagens = queue.Queue(maxsize=MQTT_FILA_MENSAGENS)
+        self.mensagens_descartadas = 0
+        self._tratadores = {
+            SOLICITAR_IP_TOPIC: self._tratar_solicitacao_ip,
+            APP_CONTROL_TOPIC: self._tratar_controle_esteira,
+            LATENCIA_APP_TOPIC: self._tratar_latencia_app,
+        }
+        
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
-            print(f"[MQTT] ✓ Conectado com sucesso!")
+            log_mqtt.info("✓ Conectado com sucesso!")
             self.connected = True
+            self.conexoes += 1
+            self.tentativas_reconexao = 0
+            self._evento_outbox.set()
             
             # Subscreve aos tópicos necessários
             client.subscribe(SOLICITAR_IP_TOPIC, qos=1)
-            print(f"[MQTT] ✓ Inscrito em: {SOLICITAR_IP_TOPIC}")
+            log_mqtt.info("✓ Inscrito em: %s", SOLICITAR_IP_TOPIC)
             
             client.subscribe(APP_CONTROL_TOPIC, qos=1)
-            print(f"[MQTT] ✓ Inscrito em: {APP_CONTROL_TOPIC}")
+            log_mqtt.info("✓ Inscrito em: %s", APP_CONTROL_TOPIC)
+            
+            client.subscribe(LATENCIA_APP_TOPIC, qos=0)
+            log_mqtt.info("✓ Inscrito em: %s", LATENCIA_APP_TOPIC)
         else:
-            print(f"[MQTT] ✗ Falha na conexão. Código: {rc}")
+            log_mqtt.error("✗ Falha na conexão. Código: %s", rc)
             self.connected = False
         
     def on_disconnect(self, client, userdata, rc):
-        print(f"[MQTT] Desconectado. Código: {rc}")
+        # A reconexão fica a cargo do supervisor, fora do callback do paho
+        log_mqtt.warning("Desconectado. Código: %s", rc)
         self.connected = False
-        if rc != 0:
-            print("[MQTT] Tentando reconectar...")
-            try:
-                client.reconnect()
-            except Exception as e:
-                print(f"[MQTT] Erro ao reconectar: {e}")
         
     def on_message(self, client, userdata, msg):
-        topic = msg.topic
-        payload = msg.payload.decode('utf-8')
-        print(f"\n[MQTT] >>> Mensagem recebida")
-        print(f"[MQTT]     Tópico: {topic}")
-        print(f"[MQTT]     Payload: {payload}")
-        
-        # Solicitação de IP - envia para dados/camera
-        if topic == SOLICITAR_IP_TOPIC:
-            print(f"[MQTT] >>> Solicitação de IP detectada!")
-            ip_response = f"http://{self.local_ip}:5000"
-            print(f"[MQTT] >>> Enviando IP: {ip_response}")
+        """Só enfileira a mensagem para não bloquear o loop de rede"""
+        try:
+            self._fila_mensagens.put_nowait((msg.topic, msg.payload))
+        except queue.Full:
+            self.mensagens_descartadas += 1
+    
+    def _processar_mensagens(self):
+        """Consome a fila de mensagens e despacha pela tabela de tópicos"""
+        while not self._parar.is_set():
+            try:
+                topic, payload = self._fila_mensagens.get(timeout=1)
+            except queue.Empty:
+                continue
             
-            result = client.publish(MQTT_TOPIC, ip_response, qos=1)
+            payload = payload.decode('utf-8', errors='replace')
+            log_mqtt.debug("<<< %s: %s", topic, payload)
             
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                print(f"[MQTT] ✓ IP enviado com sucesso para: {MQTT_TOPIC}")
-            else:
-                print(f"[MQTT] ✗ Erro ao enviar IP. Código: {result.rc}")
-        
-        # Controle da esteira de dados/app
-        elif topic == APP_CONTROL_TOPIC:
-            print(f"[MQTT] >>> Comando de esteira recebido: {payload}")
+            tratador = self._tratadores.get(topic)
+            if tratador is None:
+                log_mqtt.warning("⚠️ Tópico sem tratador: %s", topic)
+                continue
             try:
-                estado = payload.strip()
-                if estado in ['0', '1']:
-                    self.system_state.atualizar_esteira(estado)
-                    
-                    # Atualiza LCD
-                    self.lcd_controller.atualizar_status(
-                        self.system_state.esteira_ligada,
-                        self.system_state.ultima_cor_detectada
-                    )
-                else:
-                    print(f"[MQTT] ⚠️ Valor inválido para esteira: {estado}")
+                tratador(payload)
             except Exception as e:
-                print(f"[MQTT] ✗ Erro ao processar comando de esteira: {e}")
+                log_mqtt.error("✗ Erro ao processar mensagem de %s: %s", topic, e)
     
-    def connect(self, local_ip):
-        self.local_ip = local_ip
-        try:
-            print(f"[MQTT] Conectando ao broker: {MQTT_BROKER}:{MQTT_PORT}")
-            self.client.connect(MQTT_BROKER, MQTT_PORT, keepalive=60)
-            self.client.loop_start()
-            
-            # Aguarda conexão
-            timeout = 10
-            start_time = time.time()
-            while not self.connected and (time.time() - start_time) < timeout:
-                time.sleep(0.1)
+    def _tratar_solicitacao_ip(self, payload):
+        """Solicitação de IP - envia para dados/camera"""
+        ip_response = f"http://{self.local_ip}:5000"
+        result = self.client.publish(MQTT_TOPIC, ip_response, qos=1)
+        
+        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            log_mqtt.info("✓ IP %s enviado para: %s", ip_response, MQTT_TOPIC)
+        else:
+            log_mqtt.error("✗ Erro ao enviar IP. Código: %s", result.rc)
+    
+    def _tratar_controle_esteira(self, payload):
+        """Controle da esteira de dados/app"""
+        estado = payload.strip()
+        if estado not in ['0', '1']:
+            log_mqtt.warning("⚠️ Valor inválido para esteira: %s", estado)
+            return
+        
+        self.system_state.atualizar_esteira(estado)
+        self.publicar_status()
+        
+        # Atualiza LCD
+        self.lcd_controller.atualizar_status(
+            self.system_state.esteira_ligada,
+            self.system_state.ultima_cor_detectada
+        )
+    
+    def _tratar_latencia_app(self, payload):
+        """Registra o atraso entre captura e recebimento informado pelo app"""
+        dados = json.loads(payload)
+        self.medidor_latencia.registrar("recebimento_app", float(dados["delta_ms"]) / 1000)
+    
+    def connect(self, local_ip=None, timeout=10):
+        """Inicia supervisor de conexão e aguarda a primeira conexão
+        
+        Retorna False em caso de timeout, mas o supervisor continua
+        tentando reconectar em segundo plano.
+        """
+        if local_ip is not None:
+            self.local_ip = local_ip
+        
+        if not self._threads:
+            log_mqtt.info("Conectando ao broker: %s:%s", self.broker, self.porta)
+            self.client.connect_async(self.broker, self.porta, keepalive=60)
+            for alvo, nome in ((self._supervisor, "mqtt-supervisor"),
+                               (self._drenar_outbox, "mqtt-outbox"),
+                               (self._processar_mensagens, "mqtt-comandos")):
+                thread = threading.Thread(target=alvo, name=nome, daemon=True)
+                self._threads.append(thread)
+                thread.start()
+        
+        # Aguarda conexão
+        start_time = time.time()
+        while not self.connected and (time.time() - start_time) < timeout:
+            time.sleep(0.1)
+        
+        if self.connected:
+            log_mqtt.info("✓ Conexão estabelecida!")
+            return True
+        else:
+            log_mqtt.warning("✗ Timeout na conexão, reconexão continua em segundo plano")
+            return False
+    
+    def _calcular_backoff(self):
+        """Backoff exponencial com jitter (metade fixa + metade aleatória)"""
+        teto = min(MQTT_BACKOFF_MAXIMO, MQTT_BACKOFF_INICIAL * (2 ** self.tentativas_reconexao))
+        self.tentativas_reconexao += 1
+        return teto / 2 + random.uniform(0, teto / 2)
+    
+    def _supervisor(self):
+        """Mantém o loop de rede do paho e reconecta com backoff quando cai"""
+        while not self._parar.is_set():
+            if not self._socket_aberto:
+                try:
+                    self.client.reconnect()
+                    self._socket_aberto = True
+                except Exception as e:
+                    espera = self._calcular_backoff()
+                    log_mqtt.error("✗ Erro ao conectar: %s. Nova tentativa em %.1fs", e, espera)
+                    self._parar.wait(espera)
+                    continue
             
-            if self.connected:
-                print("[MQTT] ✓ Conexão estabelecida!")
+            rc = self.client.loop(timeout=1.0)
+            if rc != mqtt.MQTT_ERR_SUCCESS and not self._parar.is_set():
+                self._socket_aberto = False
+                self.connected = False
+                espera = self._calcular_backoff()
+                log_mqtt.warning("Conexão perdida (rc=%s). Reconectando em %.1fs", rc, espera)
+                self._parar.wait(espera)
+    
+    def _drenar_outbox(self):
+        """Reenvia mensagens da fila offline sempre que houver conexão"""
+        while not self._parar.is_set():
+            self._evento_outbox.wait(timeout=5)
+            self._evento_outbox.clear()
+            self.outbox.drenar(self.client, lambda: self.connected and not self._parar.is_set())
+    
+    def publicar(self, topico, payload, qos=0, persistir=True, retain=False):
+        """Publica mensagem; sem conexão, guarda na fila offline
+        
+        Enquanto houver mensagens pendentes na fila, as novas também
+        entram nela para manter a ordem de entrega.
+        
+        Returns:
+            bool: True se publicada ou enfileirada
+        """
+        if self.connected and len(self.outbox) == 0:
+            result = self.client.publish(topico, payload, qos=qos, retain=retain)
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
                 return True
-            else:
-                print("[MQTT] ✗ Timeout na conexão")
-                return False
-        except Exception as e:
-            print(f"[MQTT] ✗ Erro ao conectar: {e}")
+        
+        if not persistir:
             return False
+        
+        # Mensagens da fila usam QoS 1 para só serem removidas após confirmação
+        self.outbox.adicionar(topico, payload, max(qos, 1))
+        self._evento_outbox.set()
+        return True
+    
+    def parar(self):
+        """Encerra supervisor e desconecta"""
+        self._parar.set()
+        self._evento_outbox.set()
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
     
-    def publish_colors(self, colors):
-        """Publica a cor predominante detectada com throttling e delay"""
+    def publish_colors(self, colors, quadro=None, camera=None):
+        """Publica cores detectadas com throttling independente por câmera
+        
+        A detecção vai em binário para TELEMETRIA_DETECCAO_TOPIC e, no
+        formato de texto legado, para MQTT_TOPIC e o tópico da câmera. Com
+        o quadro de origem, publica ainda o rastreio de latência em
+        RASTREIO_TOPIC.
+        """
         current_time = time.time()
-        if current_time - self.last_send_time >= MQTT_SEND_INTERVAL:
-            if colors and colors != self.last_colors:
+        if current_time - self.last_send_time.get(camera, 0) >= perfis["intervalo_mqtt"]:
+            if colors and colors != self.last_colors.get(camera):
                 try:
-                    predominant_color = colors[0]
-                    
-                    result = self.client.publish(MQTT_TOPIC, predominant_color, qos=0)
+                    msg = ",".join(set(colors))
+                    ##AQUI QUE PUBLICA COR##
+                    inicio_publicacao = time.monotonic()
+                    if quadro is not None:
+                        binario = codificar_deteccao(quadro.seq, quadro.t_captura_epoch, camera, quadro.deteccoes)
+                    else:
+                        binario = codificar_deteccao(0, time.time(), camera, [
+                            {"cor": cor.replace("Cor:", ""), "centro": (0, 0), "raio": 0} for cor in colors])
+                    publicado = self.publicar(TELEMETRIA_DETECCAO_TOPIC, binario, qos=0)
+                    if TELEMETRIA_TEXTO_LEGADO:
+                        publicado = self.publicar(MQTT_TOPIC, msg, qos=0)
+                        if publicado and camera is not None:
+                            self.publicar(TOPICO_CAMERA.format(camera=camera), msg, qos=0)
                     
-                    if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                        self.last_colors = [predominant_color]
-                        self.last_send_time = current_time
+                    if publicado:
+                        self.last_colors[camera] = colors.copy()
+                        self.last_send_time[camera] = current_time
                         
-                        # Atualiza estado do sistema
-                        cor_nome = predominant_color.replace("Cor:", "")
-                        self.system_state.adicionar_cor(cor_nome)
-                        
-                        # Atualiza LCD
-                        self.lcd_controller.atualizar_status(
-                            self.system_state.esteira_ligada,
-                            self.system_state.ultima_cor_detectada
-                        )
-                        
-                except Exception as e:
-                    print(f"[MQTT] Erro ao publicar cores: {e}")
-                    
-    def __init__(self, system_state, lcd_controller):
-        self.client = mqtt.Client(client_id="camera_python", clean_session=True)
-        self.client.username_pw_set(MQTT_USER, MQTT_PASSWORD)
-        self.client.tls_set(cert_reqs=ssl.CERT_NONE, tls_version=ssl.PROTOCOL_TLS)
-        self.client.tls_insecure_set(True)
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
-        self.client.on_disconnect = self.on_disconnect
-        
-        self.system_state = system_state
-        self.lcd_controller = lcd_controller
-        self.last_colors = []
-        self.last_send_time = 0
-        self.connected = False
-        self.local_ip = ""
-        
-    def on_connect(self, client, userdata, flags, rc):
-        if rc == 0:
-            print(f"[MQTT] ✓ Conectado com sucesso!")
-            self.connected = True
-            
-            # Subscreve aos tópicos necessários
-            client.subscribe(SOLICITAR_IP_TOPIC, qos=1)
-            print(f"[MQTT] ✓ Inscrito em: {SOLICITAR_IP_TOPIC}")
-            
-            client.subscribe(APP_CONTROL_TOPIC, qos=1)
-            print(f"[MQTT] ✓ Inscrito em: {APP_CONTROL_TOPIC}")
-        else:
-            print(f"[MQTT] ✗ Falha na conexão. Código: {rc}")
-            self.connected = False
-        
-    def on_disconnect(self, client, userdata, rc):
-        print(f"[MQTT] Desconectado. Código: {rc}")
-        self.connected = False
-        if rc != 0:
-            print("[MQTT] Tentando reconectar...")
-            try:
-                client.reconnect()
-            except Exception as e:
-                print(f"[MQTT] Erro ao reconectar: {e}")
-        
-    def on_message(self, client, userdata, msg):
-        topic = msg.topic
-        payload = msg.payload.decode('utf-8')
-        print(f"\n[MQTT] >>> Mensagem recebida")
-        print(f"[MQTT]     Tópico: {topic}")
-        print(f"[MQTT]     Payload: {payload}")
-        
-        # Solicitação de IP - envia para dados/camera
-        if topic == SOLICITAR_IP_TOPIC:
-            print(f"[MQTT] >>> Solicitação de IP detectada!")
-            ip_response = f"http://{self.local_ip}:5000"
-            print(f"[MQTT] >>> Enviando IP: {ip_response}")
-            
-            result = client.publish(MQTT_TOPIC, ip_response, qos=1)
-            
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                print(f"[MQTT] ✓ IP enviado com sucesso para: {MQTT_TOPIC}")
-            else:
-                print(f"[MQTT] ✗ Erro ao enviar IP. Código: {result.rc}")
-        
-        # Controle da esteira de dados/app
-        elif topic == APP_CONTROL_TOPIC:
-            print(f"[MQTT] >>> Comando de esteira recebido: {payload}")
-            try:
-                estado = payload.strip()
-                if estado in ['0', '1']:
-                    self.system_state.atualizar_esteira(estado)
-                    
-                    # Atualiza LCD
-                    self.lcd_controller.atualizar_status(
-                        self.system_state.esteira_ligada,
-                        self.system_state.ultima_cor_detectada
-                    )
-                else:
-                    print(f"[MQTT] ⚠️ Valor inválido para esteira: {estado}")
-            except Exception as e:
-                print(f"[MQTT] ✗ Erro ao processar comando de esteira: {e}")
-    
-    def connect(self, local_ip):
-        self.local_ip = local_ip
-        try:
-            print(f"[MQTT] Conectando ao broker: {MQTT_BROKER}:{MQTT_PORT}")
-            self.client.connect(MQTT_BROKER, MQTT_PORT, keepalive=60)
-            self.client.loop_start()
-            
-            # Aguarda conexão
-            timeout = 10
-            start_time = time.time()
-            while not self.connected and (time.time() - start_time) < timeout:
-                time.sleep(0.1)
-            
-            if self.connected:
-                print("[MQTT] ✓ Conexão estabelecida!")
-                return True
-            else:
-                print("[MQTT] ✗ Timeout na conexão")
-                return False
-        except Exception as e:
-            print(f"[MQTT] ✗ Erro ao conectar: {e}")
-            return False
-    
-    def publish_colors(self, colors):
-        """Publica a cor predominante detectada com throttling e delay"""
-        current_time = time.time()
-        if current_time - self.last_send_time >= MQTT_SEND_INTERVAL:
-            if colors and colors != self.last_colors:
-                try:
-                    msg = ",".join(set(colors))
-                    result = self.client.publish(MQTT_TOPIC, msg, qos=0)
-                    
-                    if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                        self.last_colors = colors.copy()
-                        self.last_send_time = current_time
+                        if quadro is not None and camera is not None:
+                            quadro.marcar("publicacao", inicio_publicacao)
+                            self._publicar_rastreio(msg, quadro, camera)
                         
                         # Atualiza estado do sistema
                         for cor in colors:
                             cor_nome = cor.replace("Cor:", "")
                             self.system_state.adicionar_cor(cor_nome)
+                        self.publicar_status()
                         
                         # Atualiza LCD
                         self.lcd_controller.atualizar_status(
@@ -455,158 +1535,217 @@ class MQTTHandler:
                         )
                         
                 except Exception as e:
-                    print(f"[MQTT] Erro ao publicar cores: {e}")
+                    log_mqtt.error("Erro ao publicar cores: %s", e)
+    
+    def publicar_status(self):
+        """Publica o status binário (retido, para quem se inscrever depois)"""
+        estado = self.system_state.get_status()
+        self.publicar(TELEMETRIA_STATUS_TOPIC,
+                      codificar_status(estado["esteira_ligada"], estado["contagens"]),
+                      qos=0, persistir=False, retain=True)
+    
+    def _publicar_rastreio(self, msg, quadro, camera):
+        """Publica tempos do quadro para o app calcular o atraso de recebimento"""
+        quadro.marcar("captura_ate_publicacao", quadro.t_captura)
+        for etapa in ("publicacao", "captura_ate_publicacao"):
+            self.medidor_latencia.registrar(etapa, quadro.etapas[etapa])
+        
+        rastreio = {
+            "camera": camera,
+            "seq": quadro.seq,
+            "cores": msg,
+            "t_captura": round(quadro.t_captura_epoch, 3),
+            "etapas_ms": {etapa: round(segundos * 1000, 2) for etapa, segundos in quadro.etapas.items()}
+        }
+        self.publicar(RASTREIO_TOPIC.format(camera=camera), json.dumps(rastreio), qos=0, persistir=False)
 
-    def __init__(self, system_state, lcd_controller):
-        self.client = mqtt.Client(client_id="camera_python", clean_session=True)
-        self.client.username_pw_set(MQTT_USER, MQTT_PASSWORD)
-        self.client.tls_set(cert_reqs=ssl.CERT_NONE, tls_version=ssl.PROTOCOL_TLS)
-        self.client.tls_insecure_set(True)
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
-        self.client.on_disconnect = self.on_disconnect
+# ==============================
+# PONTE BROKER LOCAL <-> NUVEM
+# ==============================
+class PonteMQTT:
+    """Encaminha tópicos selecionados entre o broker local e o da nuvem
+    
+    O tráfego da esteira fica no broker local e continua funcionando sem
+    internet; só PONTE_PARA_NUVEM sobe para a nuvem e só PONTE_DA_NUVEM
+    (comandos do app fora da rede local) desce. Funciona com qualquer
+    broker MQTT 3.1.1 local, inclusive um mosquitto de teste.
+    
+    Sem conexão com a nuvem, o que sobe vai para uma OutboxMQTT própria
+    (exceto PONTE_SEM_FILA) e os tópicos de PONTE_RETIDOS guardam só o
+    último valor, republicado retido ao reconectar.
+    
+    O que sobe é enfileirado pelo callback do paho e encaminhado pela
+    thread da ponte, então a escrita na fila offline (SQLite) não atrasa
+    o loop de rede. verificar_ponte.py exercita a ponte entre dois
+    brokers de teste.
+    """
+    def __init__(self, broker_local=MQTT_LOCAL_BROKER, porta_local=MQTT_LOCAL_PORT,
+                 para_nuvem=PONTE_PARA_NUVEM, da_nuvem=PONTE_DA_NUVEM,
+                 retidos=PONTE_RETIDOS, sem_fila=PONTE_SEM_FILA,
+                 broker_nuvem=MQTT_BROKER, porta_nuvem=MQTT_PORT, tls_nuvem=True,
+                 arquivo_outbox=OUTBOX_PONTE_ARQUIVO):
+        # MQTT 3.1.1 não tem "no local": filtros sobrepostos criariam laço
+        for filtro in para_nuvem:
+            for outro in da_nuvem:
+                if mqtt.topic_matches_sub(filtro, outro) or mqtt.topic_matches_sub(outro, filtro):
+                    raise ValueError(f"Filtros da ponte se sobrepõem: {filtro} e {outro}")
         
-        self.system_state = system_state
-        self.lcd_controller = lcd_controller
-        self.last_colors = []
-        self.last_send_time = 0
-        self.connected = False
-        self.local_ip = ""
+        self.destinos = {
+            "local": (broker_local, porta_local),
+            "nuvem": (broker_nuvem, porta_nuvem),
+        }
+        self.clientes = {
+            "local": criar_cliente_mqtt("camera_ponte_local", MQTT_LOCAL_USER, MQTT_LOCAL_PASSWORD, tls=False),
+            "nuvem": criar_cliente_mqtt("camera_ponte", tls=tls_nuvem),
+        }
+        self.conectados = {"local": False, "nuvem": False}
+        self.encaminhadas = {"para_nuvem": 0, "da_nuvem": 0}
+        self.descartadas = 0
+        self.retidos = retidos
+        self.sem_fila = sem_fila
+        self.outbox = OutboxMQTT(arquivo_outbox)
+        self._retidos_pendentes = {}
+        self._fila = queue.Queue(maxsize=MQTT_FILA_MENSAGENS)
+        self._parar = threading.Event()
+        self._evento_outbox = threading.Event()
+        self._thread = None
+        self._configurar("local", "nuvem", para_nuvem, "para_nuvem")
+        self._configurar("nuvem", "local", da_nuvem, "da_nuvem")
+    
+    def _configurar(self, origem, destino, filtros, sentido):
+        client = self.clientes[origem]
         
-    def on_connect(self, client, userdata, flags, rc):
-        if rc == 0:
-            print(f"[MQTT] ✓ Conectado com sucesso!")
-            self.connected = True
-            
-            # Subscreve aos tópicos necessários
-            client.subscribe(SOLICITAR_IP_TOPIC, qos=1)
-            print(f"[MQTT] ✓ Inscrito em: {SOLICITAR_IP_TOPIC}")
-            
-            client.subscribe(APP_CONTROL_TOPIC, qos=1)
-            print(f"[MQTT] ✓ Inscrito em: {APP_CONTROL_TOPIC}")
-        else:
-            print(f"[MQTT] ✗ Falha na conexão. Código: {rc}")
-            self.connected = False
+        def on_connect(client, userdata, flags, rc):
+            if rc != 0:
+                log_ponte.error("✗ Falha ao conectar ao broker %s. Código: %s", origem, rc)
+                return
+            self.conectados[origem] = True
+            for filtro in filtros:
+                client.subscribe(filtro, qos=1)
+            if origem == "nuvem":
+                self._evento_outbox.set()
+            log_ponte.info("✓ Broker %s conectado", origem)
         
-    def on_disconnect(self, client, userdata, rc):
-        print(f"[MQTT] Desconectado. Código: {rc}")
-        self.connected = False
-        if rc != 0:
-            print("[MQTT] Tentando reconectar...")
-            try:
-                client.reconnect()
-            except Exception as e:
-                print(f"[MQTT] Erro ao reconectar: {e}")
+        def on_disconnect(client, userdata, rc):
+            self.conectados[origem] = False
+            log_ponte.warning("Broker %s desconectado (rc=%s)", origem, rc)
         
-    def on_message(self, client, userdata, msg):
-        topic = msg.topic
-        payload = msg.payload.decode('utf-8')
-        print(f"\n[MQTT] >>> Mensagem recebida")
-        print(f"[MQTT]     Tópico: {topic}")
-        print(f"[MQTT]     Payload: {payload}")
-        
-        # Solicitação de IP - envia para dados/camera
-        if topic == SOLICITAR_IP_TOPIC:
-            print(f"[MQTT] >>> Solicitação de IP detectada!")
-            ip_response = f"http://{self.local_ip}:5000"
-            print(f"[MQTT] >>> Enviando IP: {ip_response}")
-            
-            result = client.publish(MQTT_TOPIC, ip_response, qos=1)
-            
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                print(f"[MQTT] ✓ IP enviado com sucesso para: {MQTT_TOPIC}")
+        def on_message(client, userdata, msg):
+            if destino == "nuvem":
+                try:
+                    self._fila.put_nowait((msg.topic, msg.payload, msg.qos))
+                except queue.Full:
+                    self.descartadas += 1
+                    return
             else:
-                print(f"[MQTT] ✗ Erro ao enviar IP. Código: {result.rc}")
+                self.clientes[destino].publish(msg.topic, msg.payload, qos=msg.qos)
+            self.encaminhadas[sentido] += 1
         
-        # Controle da esteira de dados/app
-        elif topic == APP_CONTROL_TOPIC:
-            print(f"[MQTT] >>> Comando de esteira recebido: {payload}")
-            try:
-                estado = payload.strip()
-                if estado in ['0', '1']:
-                    self.system_state.atualizar_esteira(estado)
-                    
-                    # Atualiza LCD
-                    self.lcd_controller.atualizar_status(
-                        self.system_state.esteira_ligada,
-                        self.system_state.ultima_cor_detectada
-                    )
-                else:
-                    print(f"[MQTT] ⚠️ Valor inválido para esteira: {estado}")
-            except Exception as e:
-                print(f"[MQTT] ✗ Erro ao processar comando de esteira: {e}")
+        client.on_connect = on_connect
+        client.on_disconnect = on_disconnect
+        client.on_message = on_message
+        client.reconnect_delay_set(int(MQTT_BACKOFF_INICIAL), int(MQTT_BACKOFF_MAXIMO))
     
-    def connect(self, local_ip):
-        self.local_ip = local_ip
-        try:
-            print(f"[MQTT] Conectando ao broker: {MQTT_BROKER}:{MQTT_PORT}")
-            self.client.connect(MQTT_BROKER, MQTT_PORT, keepalive=60)
-            self.client.loop_start()
-            
-            # Aguarda conexão
-            timeout = 10
-            start_time = time.time()
-            while not self.connected and (time.time() - start_time) < timeout:
-                time.sleep(0.1)
-            
-            if self.connected:
-                print("[MQTT] ✓ Conexão estabelecida!")
-                return True
+    def _encaminhar_para_nuvem(self, topico, payload, qos):
+        """Publica na nuvem ou, sem conexão, guarda para reenviar depois"""
+        nuvem = self.clientes["nuvem"]
+        if any(mqtt.topic_matches_sub(filtro, topico) for filtro in self.retidos):
+            if not (self.conectados["nuvem"] and
+                    nuvem.publish(topico, payload, qos=1, retain=True).rc == mqtt.MQTT_ERR_SUCCESS):
+                self._retidos_pendentes[topico] = payload
+                self._evento_outbox.set()
             else:
-                print("[MQTT] ✗ Timeout na conexão")
-                return False
-                
-        except Exception as e:
-            print(f"[MQTT] ✗ Erro ao conectar: {e}")
-            return False
+                self._retidos_pendentes.pop(topico, None)
+            return
+        
+        # Com fila pendente, as novas também entram nela para manter a ordem
+        if self.conectados["nuvem"] and len(self.outbox) == 0:
+            if nuvem.publish(topico, payload, qos=qos).rc == mqtt.MQTT_ERR_SUCCESS:
+                return
+        if any(mqtt.topic_matches_sub(filtro, topico) for filtro in self.sem_fila):
+            return
+        self.outbox.adicionar(topico, payload, max(qos, 1))
+        self._evento_outbox.set()
     
-    def publish_colors(self, colors):
-        """Publica cores detectadas com throttling"""
-        current_time = time.time()
-        if current_time - self.last_send_time >= MQTT_SEND_INTERVAL:
-            if colors and colors != self.last_colors:
-                try:
-                    msg = ",".join(set(colors))
-                    ##AQUI QUE PUBLICA COR##
-                    novo_item = {
-                        "cores": msg,
-                        "timestamp": datetime.now().isoformat()
-                    }
-
-                    result = self.client.publish(MQTT_TOPIC, msg, qos=0)
-
-                    if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                        self.last_colors = colors.copy()
-                        self.last_send_time = current_time
-                        
-                        # Atualiza estado do sistema
-                        for cor in colors:
-                            cor_nome = cor.replace("Cor:", "")
-                            self.system_state.adicionar_cor(cor_nome)
-                        
-                        # Atualiza LCD
-                        self.lcd_controller.atualizar_status(
-                            self.system_state.esteira_ligada,
-                            self.system_state.ultima_cor_detectada
-                        )
-                        
-                except Exception as e:
-                    print(f"[MQTT] Erro ao publicar cores: {e}")
+    def _executar(self):
+        """Encaminha o que chegou do broker local e, com a nuvem conectada,
+        publica os retidos pendentes e drena a fila offline"""
+        nuvem = self.clientes["nuvem"]
+        
+        def conectado():
+            return self.conectados["nuvem"] and not self._parar.is_set()
+        
+        def drenar():
+            # Interrompe entre lotes quando chegam mensagens novas, que
+            # entram na fila depois das pendentes
+            return conectado() and self._fila.empty()
+        
+        while not self._parar.is_set():
+            try:
+                self._encaminhar_para_nuvem(*self._fila.get(timeout=1))
+                continue
+            except queue.Empty:
+                pass
+            
+            if not (self._evento_outbox.is_set() and conectado()):
+                continue
+            self._evento_outbox.clear()
+            for topico, payload in list(self._retidos_pendentes.items()):
+                if nuvem.publish(topico, payload, qos=1, retain=True).rc == mqtt.MQTT_ERR_SUCCESS:
+                    del self._retidos_pendentes[topico]
+            self.outbox.drenar(nuvem, drenar)
+            if len(self.outbox) or self._retidos_pendentes:
+                self._evento_outbox.set()
+    
+    def iniciar(self):
+        """Conecta aos dois brokers; a reconexão fica a cargo do paho"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._executar, name="ponte", daemon=True)
+            self._thread.start()
+        for nome, client in self.clientes.items():
+            host, porta = self.destinos[nome]
+            log_ponte.info("Conectando ao broker %s: %s:%s", nome, host, porta)
+            client.connect_async(host, porta, keepalive=60)
+            client.loop_start()
+    
+    def parar(self):
+        self._parar.set()
+        self._evento_outbox.set()
+        for client in self.clientes.values():
+            client.disconnect()
+            client.loop_stop()
+    
+    def get_status(self):
+        return {
+            "conectados": dict(self.conectados),
+            "encaminhadas": dict(self.encaminhadas),
+            "descartadas": self.descartadas,
+            "fila_offline": len(self.outbox),
+            "retidos_pendentes": len(self._retidos_pendentes)
+        }
 
 # ==============================
 # DETECÇÃO DE CÂMERA
 # ==============================
-def detect_camera(max_cameras=10):
-    """Detecta primeira câmera disponível"""
+def detect_cameras(max_cameras=10, ignorar=()):
+    """Detecta todas as câmeras disponíveis (exceto os índices em ignorar)"""
+    encontradas = []
     for i in range(max_cameras):
+        if i in ignorar:
+            continue
         cap = cv2.VideoCapture(i)
         if cap.isOpened():
             ret, _ = cap.read()
-            cap.release()
             if ret:
-                print(f"[CAMERA] Câmera encontrada no índice {i}")
-                return i
-    return None
+                log_camera.info("Câmera encontrada no índice %d", i)
+                encontradas.append(i)
+        cap.release()
+    return encontradas
+
+def detect_camera(max_cameras=10):
+    """Detecta primeira câmera disponível"""
+    encontradas = detect_cameras(max_cameras)
+    return encontradas[0] if encontradas else None
 
 def get_local_ip():
     """Obtém IP local da máquina"""
@@ -620,244 +1759,1121 @@ def get_local_ip():
         s.close()
     return ip
 
+def get_ngrok_url():
+    """Obtém URL pública https do túnel ngrok local, se existir"""
+    try:
+        with urllib.request.urlopen(NGROK_API_URL, timeout=2) as response:
+            json_data = json.loads(response.read().decode('utf-8'))
+        for tunnel in json_data.get('tunnels', []):
+            if tunnel.get('proto') == 'https':
+                return tunnel.get('public_url')
+    except Exception:
+        pass
+    return None
+
 # ==============================
-# DETECTOR DE CORES LEGO
+# MONITOR DE REDE
 # ==============================
-class LegoColorDetector:
-    def __init__(self):
-        self.colors = {
-            "Vermelho": ([0, 120, 70], [10, 255, 255]),
-            "Vermelho2": ([170, 120, 70], [180, 255, 255]),
-            "Azul": ([100, 150, 50], [130, 255, 255]),
-            "Amarelo": ([20, 100, 100], [35, 255, 255]),
-            "Verde": ([35, 50, 50], [85, 255, 255]),
-            "Laranja": ([10, 100, 100], [20, 255, 255]),
-            "Roxo": ([130, 50, 50], [160, 255, 255])
-        }
-        
-        self.min_area = 400
-        self.kernel = np.ones((5, 5), np.uint8)
+class MonitorRede:
+    """Mantém IP local e URL do túnel em cache e publica apenas quando mudam
     
-    def detect(self, frame):
-        """Detecta cores LEGO no frame"""
-        height, width = frame.shape[:2]
-        if width > RESOLUTION_WIDTH:
-            scale = RESOLUTION_WIDTH / width
-            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
-        
-        blurred = cv2.GaussianBlur(frame, (5, 5), 0)
-        hsv = cv2.cvtColor(blurred, cv2.COLOR_BGR2HSV)
-        
-        detected_colors = []
-        areas = []  # Lista para armazenar as áreas das cores detectadas
-        
-        for color_name, (lower, upper) in self.colors.items():
-            lower = np.array(lower)
-            upper = np.array(upper)
-            
-            mask = cv2.inRange(hsv, lower, upper)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, self.kernel)
-            
-            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            
-            for cnt in contours:
-                area = cv2.contourArea(cnt)
-                if area > self.min_area:
-                    (x, y), radius = cv2.minEnclosingCircle(cnt)
-                    center = (int(x), int(y))
-                    radius = int(radius)
-                    
-                    color_display = color_name.replace("2", "")
-                    cv2.circle(frame, center, radius, (0, 255, 0), 2)
-                    cv2.putText(frame, color_display, 
-                              (center[0] - 30, center[1] - radius - 10),
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                    
-                    detected_colors.append(f"Cor:{color_display}")
-                    areas.append((color_display, area))  # Adiciona a cor e sua área
+    A cada nova conexão com o broker tudo é publicado de novo: o IP legado
+    em MQTT_TOPIC divide o tópico com as cores e não pode ficar retido.
+    """
+    def __init__(self, mqtt_handler, intervalo=REDE_INTERVALO_VERIFICACAO):
+        self.mqtt_handler = mqtt_handler
+        self.intervalo = intervalo
+        self.ip_local = None
+        self.url_tunel = None
+        self._publicados = {}
+        self._conexao = 0
+        self._parar = threading.Event()
+        self._thread = None
 
-        # Agora, escolhemos a cor com a maior área
-        if areas:
-            predominant_color = max(areas, key=lambda item: item[1])[0]  # Cor com maior área
-            return frame, [predominant_color]  # Retorna apenas a cor predominante
-        
-        return frame, []
-    def __init__(self):
-        self.colors = {
-            "Vermelho": ([0, 120, 70], [10, 255, 255]),
-            "Vermelho2": ([170, 120, 70], [180, 255, 255]),
-            "Azul": ([100, 150, 50], [130, 255, 255]),
-            "Amarelo": ([20, 100, 100], [35, 255, 255]),
-            "Verde": ([35, 50, 50], [85, 255, 255]),
-            "Laranja": ([10, 100, 100], [20, 255, 255]),
-            "Roxo": ([130, 50, 50], [160, 255, 255])
-        }
+    @property
+    def url_local(self):
+        return f"http://{self.ip_local}:5000" if self.ip_local else None
+
+    def atualizar(self):
+        """Verifica IP local e túnel e publica o que tiver mudado"""
+        ip = get_local_ip()
+        if ip != self.ip_local:
+            log_rede.info("IP local: %s -> %s", self.ip_local, ip)
+            self.ip_local = ip
+            self.mqtt_handler.local_ip = ip
         
-        self.min_area = 400
-        self.kernel = np.ones((5, 5), np.uint8)
-    
-    def detect(self, frame):
-        """Detecta cores LEGO no frame"""
-        height, width = frame.shape[:2]
-        if width > RESOLUTION_WIDTH:
-            scale = RESOLUTION_WIDTH / width
-            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        url = get_ngrok_url()
+        if url != self.url_tunel:
+            log_rede.info("Túnel: %s -> %s", self.url_tunel, url)
+            self.url_tunel = url
         
-        blurred = cv2.GaussianBlur(frame, (5, 5), 0)
-        hsv = cv2.cvtColor(blurred, cv2.COLOR_BGR2HSV)
+        self.publicar_pendentes()
+
+    def publicar_pendentes(self):
+        """Publica valores que ainda não foram entregues ao broker"""
+        if not self.mqtt_handler.connected:
+            return
+        if self.mqtt_handler.conexoes != self._conexao:
+            self._conexao = self.mqtt_handler.conexoes
+            self._publicados.clear()
         
-        detected_colors = []
-        areas = []  # Lista para armazenar as áreas das cores detectadas
+        mensagens = [
+            (NGROK_TOPIC, self.url_tunel, True),
+            (TELEMETRIA_DESCOBERTA_TOPIC, self.url_local and codificar_descoberta(
+                self.ip_local, self.url_local, self.url_tunel), True),
+        ]
+        if TELEMETRIA_TEXTO_LEGADO:
+            mensagens.insert(0, (MQTT_TOPIC, self.url_local, False))
         
-        for color_name, (lower, upper) in self.colors.items():
-            lower = np.array(lower)
-            upper = np.array(upper)
-            
-            mask = cv2.inRange(hsv, lower, upper)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, self.kernel)
-            
-            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            
-            for cnt in contours:
-                area = cv2.contourArea(cnt)
-                if area > self.min_area:
-                    (x, y), radius = cv2.minEnclosingCircle(cnt)
-                    center = (int(x), int(y))
-                    radius = int(radius)
-                    
-                    color_display = color_name.replace("2", "")
-                    cv2.circle(frame, center, radius, (0, 255, 0), 2)
-                    cv2.putText(frame, color_display, 
-                              (center[0] - 30, center[1] - radius - 10),
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                    
-                    detected_colors.append(f"Cor:{color_display}")
-                    areas.append((color_display, area))  # Adiciona a cor e sua área
+        for topico, valor, retain in mensagens:
+            if not valor or self._publicados.get(topico) == valor:
+                continue
+            result = self.mqtt_handler.client.publish(topico, valor, qos=1, retain=retain)
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                self._publicados[topico] = valor
+                descricao = valor if isinstance(valor, str) else f"{len(valor)} bytes"
+                log_rede.info("✓ %s publicado em: %s", descricao, topico)
 
-        # Agora, escolhemos a cor com a maior área
-        if areas:
-            predominant_color = max(areas, key=lambda item: item[1])[0]
-            return frame, [predominant_color]
-        
-        return frame, []
+    def iniciar(self):
+        """Faz a primeira verificação e inicia a thread de monitoramento"""
+        self.atualizar()
+        self._thread = threading.Thread(target=self._loop, name="monitor-rede", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.atualizar()
+            except Exception as e:
+                log_rede.error("Erro ao verificar rede: %s", e)
+
+    def parar(self):
+        self._parar.set()
+
+# ==============================
+# INICIALIZAÇÃO PARALELA
+# ==============================
+class InicializacaoSistema:
+    """Inicializa subsistemas em paralelo e acompanha a prontidão de cada um"""
+    INICIANDO = "iniciando"
+    PRONTO = "pronto"
+    FALHOU = "falhou"
 
     def __init__(self):
-        self.colors = {
-            "Vermelho": ([0, 120, 70], [10, 255, 255]),
-            "Vermelho2": ([170, 120, 70], [180, 255, 255]),
-            "Azul": ([100, 150, 50], [130, 255, 255]),
-            "Amarelo": ([20, 100, 100], [35, 255, 255]),
-            "Verde": ([35, 50, 50], [85, 255, 255]),
-            "Laranja": ([10, 100, 100], [20, 255, 255]),
-            "Roxo": ([130, 50, 50], [160, 255, 255])
-        }
-        
-        self.min_area = 400
-        self.kernel = np.ones((5, 5), np.uint8)
+        self._lock = threading.Lock()
+        self._subsistemas = {}
+        self._prontidao = {}
+        self._threads = []
+
+    def registrar(self, nome, funcao, prontidao=None):
+        """Executa a inicialização de um subsistema em thread própria
+
+        Args:
+            nome (str): Nome do subsistema exibido no /health
+            funcao (callable): Função de inicialização. Retornar False ou
+                lançar exceção marca o subsistema como falho
+            prontidao (callable, optional): Consultada a cada /health após
+                a inicialização, para subsistemas que se recuperam sozinhos
+                (ex.: reconexão MQTT). Substitui o resultado de funcao
+        """
+        with self._lock:
+            self._subsistemas[nome] = {"estado": self.INICIANDO, "erro": None, "duracao": None}
+            if prontidao is not None:
+                self._prontidao[nome] = prontidao
+        thread = threading.Thread(target=self._executar, args=(nome, funcao),
+                                  name=f"init-{nome}", daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def _executar(self, nome, funcao):
+        inicio = time.time()
+        erro = None
+        try:
+            estado = self.FALHOU if funcao() is False else self.PRONTO
+        except Exception as e:
+            estado = self.FALHOU
+            erro = str(e)
+        duracao = time.time() - inicio
+        with self._lock:
+            self._subsistemas[nome] = {"estado": estado, "erro": erro, "duracao": round(duracao, 3)}
+        log_init.info("%s: %s em %.2fs%s", nome, estado, duracao, f" ({erro})" if erro else "")
+
+    def aguardar(self, timeout=None):
+        """Aguarda todas as inicializações registradas terminarem"""
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def get_status(self):
+        """Retorna estado geral e estado de cada subsistema"""
+        with self._lock:
+            subsistemas = {nome: dict(info) for nome, info in self._subsistemas.items()}
+            prontidoes = dict(self._prontidao)
+        for nome, prontidao in prontidoes.items():
+            info = subsistemas[nome]
+            if info["estado"] != self.INICIANDO and info["erro"] is None:
+                info["estado"] = self.PRONTO if prontidao() else self.FALHOU
+        estados = [info["estado"] for info in subsistemas.values()]
+        if self.INICIANDO in estados:
+            geral = "iniciando"
+        elif self.FALHOU in estados:
+            geral = "degradado"
+        else:
+            geral = "ok"
+        return {"status": geral, "subsistemas": subsistemas}
+
+# ==============================
+# DETECÇÃO REMOTA
+# ==============================
+class WorkerRemoto:
+    """Conexão TCP com um worker de detecção, uma requisição por vez"""
+    def __init__(self, endereco, timeout=DETECCAO_REMOTA_TIMEOUT_S):
+        host, _, porta = endereco.rpartition(":")
+        self.endereco = endereco
+        self.destino = (host, int(porta))
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.sock = None
+        self._proxima_tentativa = 0
+    
+    @property
+    def conectado(self):
+        return self.sock is not None
     
-    def detect(self, frame):
-        """Detecta cores LEGO no frame"""
-        height, width = frame.shape[:2]
-        if width > RESOLUTION_WIDTH:
-            scale = RESOLUTION_WIDTH / width
-            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    def detectar(self, seq, pedido):
+        """Envia o pedido (codificar_pedido) e aguarda as detecções com o mesmo seq
         
-        blurred = cv2.GaussianBlur(frame, (5, 5), 0)
-        hsv = cv2.cvtColor(blurred, cv2.COLOR_BGR2HSV)
+        Returns:
+            list | None: detecções, ou None se o worker estiver indisponível
+        """
+        if self.sock is None:
+            if time.monotonic() < self._proxima_tentativa:
+                return None
+            try:
+                self.sock = socket.create_connection(self.destino, timeout=self.timeout)
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                log_deteccao.info("✓ Worker remoto %s conectado", self.endereco)
+            except OSError:
+                self._proxima_tentativa = time.monotonic() + DETECCAO_REMOTA_RECONEXAO_S
+                return None
         
-        detected_colors = []
+        try:
+            enviar_mensagem_deteccao(self.sock, seq, pedido)
+            # Respostas atrasadas de quadros anteriores são descartadas
+            seq_resposta = None
+            while seq_resposta != seq:
+                seq_resposta, resposta = receber_mensagem_deteccao(self.sock)
+            deteccoes = json.loads(resposta)
+        except (OSError, ValueError) as e:
+            log_deteccao.warning("Worker remoto %s indisponível: %s", self.endereco, e)
+            self.fechar()
+            self._proxima_tentativa = time.monotonic() + DETECCAO_REMOTA_RECONEXAO_S
+            return None
         
-        for color_name, (lower, upper) in self.colors.items():
-            lower = np.array(lower)
-            upper = np.array(upper)
-            
-            mask = cv2.inRange(hsv, lower, upper)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, self.kernel)
-            
-            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            
-            for cnt in contours:
-                area = cv2.contourArea(cnt)
-                if area > self.min_area:
-                    (x, y), radius = cv2.minEnclosingCircle(cnt)
-                    center = (int(x), int(y))
-                    radius = int(radius)
-                    
-                    color_display = color_name.replace("2", "")
-                    cv2.circle(frame, center, radius, (0, 255, 0), 2)
-                    cv2.putText(frame, color_display, 
-                              (center[0] - 30, center[1] - radius - 10),
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                    
-                    detected_colors.append(f"Cor:{color_display}")
+        for deteccao in deteccoes:
+            deteccao["centro"] = tuple(deteccao["centro"])
+        return deteccoes
+    
+    def fechar(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+class ClienteDeteccaoRemota:
+    """Distribui a detecção entre workers remotos (worker_deteccao.py)
+    
+    O quadro vai em JPEG marcado com o seq e a resposta volta com o mesmo
+    seq. Se nenhum worker estiver livre, conectado ou responder dentro de
+    DETECCAO_REMOTA_TIMEOUT_S, retorna None e a câmera usa a detecção local.
+    """
+    def __init__(self, enderecos=DETECCAO_REMOTA_WORKERS):
+        self.workers = [WorkerRemoto(endereco) for endereco in enderecos]
+        self._inicio = itertools.count()
+        self._lock = threading.Lock()
+        self.quadros_remotos = 0
+        self.quadros_locais = 0
+    
+    @property
+    def ativo(self):
+        return bool(self.workers)
+    
+    def detectar(self, seq, frame):
+        """Detecções do frame calculadas por um worker remoto, ou None
         
-        return frame, detected_colors
+        O worker detecta no tamanho do frame recebido, então as
+        coordenadas voltam na escala de frame.
+        """
+        deteccoes = None
+        pedido = None
+        inicio = next(self._inicio)
+        for i in range(len(self.workers)):
+            worker = self.workers[(inicio + i) % len(self.workers)]
+            if not worker.lock.acquire(blocking=False):
+                continue
+            try:
+                if pedido is None:
+                    ret, buffer = cv2.imencode('.jpg', frame,
+                                               [cv2.IMWRITE_JPEG_QUALITY, DETECCAO_REMOTA_JPEG_QUALIDADE])
+                    pedido = codificar_pedido(perfis["kernel"], buffer.tobytes())
+                deteccoes = worker.detectar(seq, pedido)
+            finally:
+                worker.lock.release()
+            if deteccoes is not None:
+                break
+        
+        with self._lock:
+            if deteccoes is None:
+                self.quadros_locais += 1
+            else:
+                self.quadros_remotos += 1
+        return deteccoes
+    
+    def parar(self):
+        for worker in self.workers:
+            with worker.lock:
+                worker.fechar()
+    
+    def get_status(self):
+        return {
+            "workers": {worker.endereco: worker.conectado for worker in self.workers},
+            "quadros_remotos": self.quadros_remotos,
+            "quadros_locais": self.quadros_locais
+        }
 
 # ==============================
 # GERADOR DE STREAM
 # ==============================
 class CameraStream:
-    def __init__(self, camera_index, mqtt_handler, system_state):
+    """Captura contínua da câmera em thread própria
+    
+    Cada frame lido recebe número de sequência e horário de captura, passa
+    pela detecção e publicação e fica disponível para os geradores de
+    stream, que apenas aguardam o próximo quadro.
+    
+    Anotação e codificação JPEG só acontecem para variantes com
+    visualizadores ativos; sem ninguém assistindo, o pipeline faz apenas
+    detecção e telemetria.
+    
+    Com um PoolDeteccao, a thread da câmera apenas captura e o
+    processamento roda nos workers compartilhados.
+    """
+    VARIANTES_STREAM = ("anotado", "cru")
+    FLAGS_REDUCAO = {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8,
+    }
+
+    def __init__(self, camera_index, mqtt_handler, system_state, agendador_atuacao=None,
+                 medidor_latencia=None, barramento_eventos=None, armazem_recortes=None,
+                 nome="cam0", pool_deteccao=None, deteccao_remota=None, redescobrir=None,
+                 taxas_pecas=None):
         self.camera_index = camera_index
+        self.taxas_pecas = taxas_pecas
+        self.redescobrir = redescobrir
+        self.deteccao_remota = deteccao_remota
+        self.nome = nome
+        self.pool_deteccao = pool_deteccao
         self.mqtt_handler = mqtt_handler
         self.system_state = system_state
-        self.detector = LegoColorDetector()
+        self.agendador_atuacao = agendador_atuacao
+        self.medidor_latencia = medidor_latencia or MedidorLatencia()
+        self.barramento_eventos = barramento_eventos
+        self.armazem_recortes = armazem_recortes
+        self.detector = LegoColorDetector(perfis)
         self.cap = None
         self.running = False
+        self._reconfigurar = False
+        self._flag_decodificacao = cv2.IMREAD_COLOR
+        self._mjpeg_recusado = False
+        self._t_ultimo_frame = time.monotonic()
+        self._t_reabertura = 0.0
+        self._tentativas_recuperacao = 0
+        self.recuperacoes = 0
+        self.reaberturas = 0
+        self._seq = itertools.count(1)
+        self._ultimo_quadro = None
+        self._recentes = deque(maxlen=QUADROS_RECENTES)
+        self._cond = threading.Condition()
+        self._thread = None
+        self.instancia = format(int(time.time()), 'x')
+        self._assinantes = {variante: 0 for variante in self.VARIANTES_STREAM + ("metadados",)}
+        self._lock_assinantes = threading.Lock()
         
     def start_capture(self):
         """Inicializa captura de vídeo"""
         self.cap = cv2.VideoCapture(self.camera_index)
-        
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, RESOLUTION_WIDTH)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, RESOLUTION_HEIGHT)
-        self.cap.set(cv2.CAP_PROP_FPS, FPS_TARGET)
-        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self._configurar_captura()
         
         if not self.cap.isOpened():
             raise Exception("Erro ao abrir câmera")
         
         self.running = True
-        print(f"[CAMERA] Captura iniciada: {RESOLUTION_WIDTH}x{RESOLUTION_HEIGHT} @ {FPS_TARGET}fps")
+        self._t_ultimo_frame = time.monotonic()
+        self._thread = threading.Thread(target=self._loop_captura, name=f"captura-{self.nome}", daemon=True)
+        self._thread.start()
+        log_camera.info("%s: captura iniciada (%s)", self.nome, self.camera_index)
     
-    def generate_frames(self):
-        """Gerador de frames para streaming"""
+    def _configurar_captura(self):
+        """Aplica resolução e FPS do perfil ativo à câmera"""
+        mjpg = cv2.VideoWriter_fourcc(*"MJPG")
+        if CAPTURA_MJPEG and not self._mjpeg_recusado:
+            self.cap.set(cv2.CAP_PROP_FOURCC, mjpg)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, perfis["largura"])
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, perfis["altura"])
+        self.cap.set(cv2.CAP_PROP_FPS, perfis["fps"])
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self._reconfigurar = False
+        
+        if CAPTURA_MJPEG and not self._mjpeg_recusado:
+            # Só desliga a conversão com MJPG de fato negociado; senão o V4L2
+            # devolveria YUYV cru num buffer 1xN
+            fourcc = int(self.cap.get(cv2.CAP_PROP_FOURCC))
+            if fourcc == mjpg:
+                self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+            else:
+                self._recusar_mjpeg(fourcc.to_bytes(4, "little").decode("ascii", "replace"))
+        
+        # Decodifica o JPEG direto na escala da detecção (1/2, 1/4 ou 1/8)
+        largura = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or perfis["largura"]
+        fator = next(f for f in (8, 4, 2, 1) if f == 1 or largura / f >= perfis["largura_deteccao"])
+        self._flag_decodificacao = self.FLAGS_REDUCAO[fator]
+        log_camera.info("%s: %dx%d @ %dfps", self.nome, perfis["largura"], perfis["altura"], perfis["fps"],
+                        extra={"campos": {"reducao_jpeg": fator}})
+    
+    def _recusar_mjpeg(self, formato):
+        """Usa a captura com conversão para BGR pelo resto da execução"""
+        self._mjpeg_recusado = True
+        log_camera.warning("%s: câmera não entrega MJPEG (%s), capturando com conversão para BGR",
+                           self.nome, formato)
+    
+    def _decodificar(self, frame):
+        """Separa o JPEG da câmera, se o frame vier comprimido
+        
+        Um buffer que nem começa como JPEG indica que o formato não foi
+        negociado: a conversão é religada e o frame, descartado.
+        
+        Returns:
+            tuple: (imagem BGR ou None, bytes JPEG da câmera ou None)
+        """
+        if frame.ndim == 3:
+            return frame, None
+        buffer = frame.reshape(-1)
+        if buffer[:2].tobytes() != b"\xff\xd8":
+            self._recusar_mjpeg("buffer sem cabeçalho JPEG")
+            # Nem todo backend aceita religar a conversão com a captura aberta
+            self.cap.release()
+            self.cap = cv2.VideoCapture(self.camera_index)
+            self._configurar_captura()
+            return None, None
+        imagem = cv2.imdecode(buffer, self._flag_decodificacao)
+        return imagem, buffer.tobytes()
+    
+    def reconfigurar(self):
+        """Pede à thread de captura para aplicar o perfil antes do próximo frame"""
+        self._reconfigurar = True
+    
+    def _loop_captura(self):
+        """Lê e carimba frames enquanto a captura estiver ativa
+        
+        Sem frame bom por CAPTURA_IDADE_MAXIMA_S, a câmera é reaberta (e,
+        se preciso, redescoberta) com backoff exponencial.
+        """
         while self.running:
-            ret, frame = self.cap.read()
+            if self._reconfigurar and self.cap is not None:
+                self._configurar_captura()
+            try:
+                ret, frame = self.cap.read() if self.cap is not None else (False, None)
+            except cv2.error:
+                ret, frame = False, None
+            t_captura = time.monotonic()
             if not ret:
-                print("[CAMERA] Erro ao ler frame")
-                time.sleep(0.1)
+                log_camera.warning("Erro ao ler frame", extra={"campos": {"camera": self.nome},
+                                                                "chave_limite": self.nome})
+                if self._precisa_recuperar():
+                    self._recuperar()
+                else:
+                    time.sleep(0.1)
                 continue
             
-            processed_frame, detected_colors = self.detector.detect(frame)
-            
-            # Armazena último frame para captura
-            self.system_state.ultimo_frame = processed_frame.copy()
+            inicio = time.monotonic()
+            imagem, jpeg_camera = self._decodificar(frame)
+            if imagem is None:
+                if jpeg_camera is not None:
+                    log_camera.warning("JPEG inválido da câmera", extra={"campos": {"camera": self.nome},
+                                                                        "chave_limite": self.nome})
+                if self._precisa_recuperar():
+                    self._recuperar()
+                continue
             
-            # Adiciona informações no frame
+            if self._tentativas_recuperacao:
+                self.recuperacoes += 1
+                self._tentativas_recuperacao = 0
+                log_camera.info("%s: ✓ captura recuperada após %.1fs sem frames", self.nome,
+                                t_captura - self._t_ultimo_frame)
+            self._t_ultimo_frame = t_captura
+            quadro = QuadroCapturado(next(self._seq), imagem, t_captura, jpeg_camera)
+            if jpeg_camera is not None:
+                quadro.marcar("decodificacao", inicio)
+            if self.pool_deteccao:
+                self.pool_deteccao.enviar(self, quadro)
+            else:
+                self.concluir(quadro)
+    
+    @property
+    def idade_ultimo_frame(self):
+        """Segundos desde o último frame lido com sucesso"""
+        return time.monotonic() - self._t_ultimo_frame
+    
+    def _precisa_recuperar(self):
+        """Sem frame bom há tempo demais, contando a carência após cada reabertura"""
+        referencia = max(self._t_ultimo_frame, self._t_reabertura)
+        return time.monotonic() - referencia > CAPTURA_IDADE_MAXIMA_S
+    
+    def _recuperar(self):
+        """Aguarda o backoff e tenta reabrir a câmera ou achar outra livre"""
+        espera = min(CAPTURA_BACKOFF_MAXIMO_S,
+                     CAPTURA_BACKOFF_INICIAL_S * (2 ** self._tentativas_recuperacao))
+        self._tentativas_recuperacao += 1
+        log_camera.warning("%s: sem frames há %.1fs, reabrindo em %.1fs (tentativa %d)", self.nome,
+                           self.idade_ultimo_frame, espera, self._tentativas_recuperacao)
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        
+        limite = time.monotonic() + espera
+        while self.running and time.monotonic() < limite:
+            time.sleep(0.1)
+        if not self.running:
+            return
+        
+        # O índice de uma câmera USB pode mudar ao reconectar
+        candidatos = [self.camera_index]
+        if self.redescobrir and isinstance(self.camera_index, int) and self._tentativas_recuperacao > 1:
+            candidatos += [i for i in self.redescobrir(self) if i != self.camera_index]
+        
+        for dispositivo in candidatos:
+            self.reaberturas += 1
+            cap = cv2.VideoCapture(dispositivo)
+            if cap.isOpened():
+                if dispositivo != self.camera_index:
+                    log_camera.info("%s: câmera redescoberta em %s", self.nome, dispositivo)
+                self.cap = cap
+                self.camera_index = dispositivo
+                self._configurar_captura()
+                self._t_reabertura = time.monotonic()
+                return
+            cap.release()
+    
+    def get_saude(self):
+        """Idade do último frame e contadores do watchdog"""
+        idade = self.idade_ultimo_frame
+        if not self.running:
+            estado = "parada"
+        elif idade <= CAPTURA_IDADE_MAXIMA_S:
+            estado = "ok"
+        else:
+            estado = "recuperando"
+        return {
+            "estado": estado,
+            "idade_ultimo_frame_s": round(idade, 2),
+            "recuperacoes": self.recuperacoes,
+            "reaberturas": self.reaberturas
+        }
+    
+    def concluir(self, quadro):
+        """Processa o quadro e o entrega aos visualizadores"""
+        try:
+            self._processar(quadro)
+        except Exception as e:
+            log_camera.error("Erro ao processar frame: %s", e,
+                             extra={"campos": {"camera": self.nome, "seq": quadro.seq}})
+            return
+        
+        with self._cond:
+            self._ultimo_quadro = quadro
+            self._recentes.append(quadro)
+            self._cond.notify_all()
+    
+    def _processar(self, quadro):
+        """Detecção, agendamento dos ejetores e publicação de um quadro"""
+        inicio = time.monotonic()
+        processed_frame, deteccoes = self._detectar(quadro)
+        quadro.marcar("deteccao", inicio)
+        quadro.imagem = processed_frame
+        quadro.deteccoes = deteccoes
+        detected_colors = [f"Cor:{deteccao['cor']}" for deteccao in deteccoes]
+        
+        # Conta peças e agenda ejetores apenas com a esteira em movimento
+        pecas_novas = []
+        if self.system_state.esteira_ligada and deteccoes:
+            inicio = time.monotonic()
+            largura = processed_frame.shape[1]
+            for deteccao in deteccoes:
+                x = deteccao["centro"][0]
+                if self.taxas_pecas and self.taxas_pecas.registrar_deteccao(
+                        self.nome, deteccao["cor"], posicao_na_esteira_m(x, largura), quadro.t_captura):
+                    pecas_novas.append(deteccao)
+                if self.agendador_atuacao:
+                    self.agendador_atuacao.agendar_deteccao(deteccao["cor"], x, largura, quadro.t_captura)
+            quadro.marcar("atuacao", inicio)
+        
+        for deteccao in pecas_novas:
+            self._publicar_evento_peca(quadro, deteccao)
+        if detected_colors:
+            self.mqtt_handler.publish_colors(detected_colors, quadro, self.nome)
+        
+        # Codifica uma vez por quadro, compartilhado entre os visualizadores
+        for variante in self.VARIANTES_STREAM:
+            if self._assinantes[variante]:
+                self.obter_jpeg(quadro, variante)
+        self.medidor_latencia.registrar_quadro(quadro)
+    
+    def _detectar(self, quadro):
+        """Detecção remota, se houver worker disponível, senão local"""
+        if self.deteccao_remota and self.deteccao_remota.ativo:
+            frame = self.detector.redimensionar(quadro.imagem)
+            deteccoes = self.deteccao_remota.detectar(quadro.seq, frame)
+            if deteccoes is not None:
+                return frame, deteccoes
+            return self.detector.detectar_objetos(frame)
+        return self.detector.detectar_objetos(quadro.imagem)
+    
+    def _publicar_evento_peca(self, quadro, deteccao):
+        """Salva o recorte de uma peça recém-contada e publica o evento no feed local
+        
+        Só recebe peças que TaxasPecas.registrar_deteccao contou, então cada
+        peça gera um único evento e um único recorte, no primeiro quadro em
+        que aparece.
+        """
+        evento = {
+            "camera": self.nome,
+            "quadro": quadro.seq,
+            "t_captura": round(quadro.t_captura_epoch, 3),
+            "cor": deteccao["cor"],
+            "x": deteccao["centro"][0],
+            "y": deteccao["centro"][1],
+            "raio": deteccao["raio"]
+        }
+        if self.armazem_recortes:
+            evento["recorte"] = self.armazem_recortes.salvar(quadro.imagem, deteccao)
+        if self.barramento_eventos:
+            self.barramento_eventos.publicar("deteccao", evento)
+    
+    @property
+    def ultimo_quadro(self):
+        return self._ultimo_quadro
+    
+    def anotar(self, quadro, com_status=True):
+        """Retorna cópia da imagem do quadro com detecções (e status) desenhados"""
+        imagem = quadro.imagem.copy()
+        self.detector.desenhar_deteccoes(imagem, quadro.deteccoes)
+        if com_status:
             status_esteira = "ON" if self.system_state.esteira_ligada else "OFF"
-            cv2.putText(processed_frame, f"FPS: {FPS_TARGET} | Esteira: {status_esteira}", 
+            cv2.putText(imagem, f"FPS: {perfis['fps']} | Esteira: {status_esteira}", 
                        (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-            
-            if detected_colors:
-                self.mqtt_handler.publish_colors(detected_colors)
-            
-            ret, buffer = cv2.imencode('.jpg', processed_frame, 
-                                      [cv2.IMWRITE_JPEG_QUALITY, 85])
-            frame_bytes = buffer.tobytes()
-            
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        return imagem
+    
+    def obter_jpeg(self, quadro, variante, qualidade=None):
+        """JPEG do quadro na variante pedida, codificado uma única vez
+        
+        Args:
+            variante (str): 'anotado' (detecções e status), 'captura'
+                (só detecções) ou 'cru' (sem anotações)
+            qualidade (int): None usa a qualidade de stream do perfil
+        
+        Com captura MJPEG, a variante 'cru' repassa o JPEG da câmera sem
+        recodificar (na resolução da câmera, não na da detecção).
+        """
+        if variante == "cru" and quadro.jpeg_camera is not None:
+            return quadro.jpeg_camera
+        qualidade = qualidade or perfis["jpeg_stream"]
+        chave = (variante, qualidade)
+        jpeg = quadro.jpeg.get(chave)
+        if jpeg is None:
+            inicio = time.monotonic()
+            if variante == "anotado":
+                imagem = self.anotar(quadro)
+            elif variante == "captura":
+                imagem = self.anotar(quadro, com_status=False)
+            else:
+                imagem = quadro.imagem
+            ret, buffer = cv2.imencode('.jpg', imagem, [cv2.IMWRITE_JPEG_QUALITY, qualidade])
+            jpeg = buffer.tobytes()
+            quadro.jpeg[chave] = jpeg
+            quadro.marcar("codificacao", inicio)
+        return jpeg
+    
+    def etag(self, quadro, variante):
+        """ETag do quadro: muda a cada quadro e a cada reinício da captura"""
+        return f"{self.instancia}-{quadro.seq}-{variante}"
+    
+    def _alterar_assinantes(self, variante, delta):
+        with self._lock_assinantes:
+            self._assinantes[variante] += delta
+            total = self._assinantes[variante]
+        log_camera.info("%s: visualizadores '%s': %d", self.nome, variante, total)
+    
+    def get_assinantes(self):
+        """Número de visualizadores ativos por variante"""
+        with self._lock_assinantes:
+            return dict(self._assinantes)
+    
+    def aguardar_quadro(self, apos_seq=0, timeout=1.0, proximo=False):
+        """Aguarda um quadro com seq > apos_seq
+        
+        Args:
+            apos_seq (int): Último quadro que o cliente já tem
+            timeout (float): Tempo máximo de espera em segundos
+            proximo (bool): True retorna o quadro seguinte a apos_seq, se
+                ainda estiver entre os QUADROS_RECENTES; False retorna o
+                mais recente
+        
+        Returns:
+            QuadroCapturado | None: None se o timeout expirar
+        """
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._ultimo_quadro is not None and self._ultimo_quadro.seq > apos_seq,
+                timeout)
+            quadro = self._ultimo_quadro
+            if quadro is None or quadro.seq <= apos_seq:
+                return None
+            if proximo:
+                return next(q for q in self._recentes if q.seq > apos_seq)
+        return quadro
+    
+    def generate_frames(self, overlay=True):
+        """Gerador de frames para streaming
+        
+        Args:
+            overlay (bool): False envia o frame sem anotações, para clientes
+                que desenham as detecções a partir de /camera_ia/metadados
+                (escalando de w x h dos metadados para o tamanho do frame)
+        """
+        variante = "anotado" if overlay else "cru"
+        self._alterar_assinantes(variante, 1)
+        try:
+            ultimo_seq = 0
+            while self.running:
+                quadro = self.aguardar_quadro(ultimo_seq)
+                if quadro is None:
+                    continue
+                ultimo_seq = quadro.seq
+                
+                # Normalmente já codificado pelo pipeline; logo após a conexão
+                # o primeiro quadro é codificado aqui
+                frame_bytes = self.obter_jpeg(quadro, variante)
+                self.medidor_latencia.registrar("captura_ate_stream", time.monotonic() - quadro.t_captura)
+                
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n'
+                       b'X-Frame-Seq: ' + str(quadro.seq).encode() + b'\r\n\r\n' + frame_bytes + b'\r\n')
+        finally:
+            self._alterar_assinantes(variante, -1)
+    
+    def generate_metadados(self):
+        """Gerador de metadados por quadro (uma linha JSON por quadro)"""
+        self._alterar_assinantes("metadados", 1)
+        try:
+            ultimo_seq = 0
+            while self.running:
+                quadro = self.aguardar_quadro(ultimo_seq)
+                if quadro is None:
+                    continue
+                ultimo_seq = quadro.seq
+                yield json.dumps(quadro.metadados(), separators=(",", ":")) + "\n"
+        finally:
+            self._alterar_assinantes("metadados", -1)
     
     def stop(self):
         """Para captura"""
         self.running = False
-        if self.cap:
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self.cap is not None:
             self.cap.release()
 
+# ==============================
+# GERENCIADOR DE CÂMERAS
+# ==============================
+class PoolDeteccao:
+    """Workers de detecção compartilhados entre as câmeras
+    
+    Cada câmera tem no máximo um quadro em processamento e um aguardando;
+    um quadro novo substitui o que ainda aguardava. Assim a fila fica
+    limitada ao número de câmeras e uma câmera não acumula atraso nem
+    ocupa os workers das outras.
+    """
+    def __init__(self, num_workers=DETECCAO_WORKERS):
+        self.num_workers = num_workers
+        self._cond = threading.Condition()
+        self._pendentes = OrderedDict()
+        self._ocupadas = set()
+        self._threads = []
+        self.descartados = {}
+    
+    def iniciar(self):
+        """Inicia os workers (uma única vez)"""
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.num_workers):
+                thread = threading.Thread(target=self._executar, name=f"deteccao-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        log_deteccao.info("%d workers iniciados", self.num_workers)
+    
+    def enviar(self, camera_stream, quadro):
+        """Agenda o quadro, descartando o que a câmera ainda tinha aguardando"""
+        with self._cond:
+            if camera_stream in self._pendentes:
+                self.descartados[camera_stream.nome] = self.descartados.get(camera_stream.nome, 0) + 1
+            self._pendentes[camera_stream] = quadro
+            self._cond.notify()
+    
+    def _proxima_tarefa(self):
+        """Primeira câmera com quadro aguardando e nenhum em processamento"""
+        for camera_stream in self._pendentes:
+            if camera_stream not in self._ocupadas:
+                self._ocupadas.add(camera_stream)
+                return camera_stream, self._pendentes.pop(camera_stream)
+        return None
+    
+    def _executar(self):
+        while True:
+            with self._cond:
+                tarefa = self._proxima_tarefa()
+                while tarefa is None:
+                    self._cond.wait()
+                    tarefa = self._proxima_tarefa()
+            
+            camera_stream, quadro = tarefa
+            try:
+                camera_stream.concluir(quadro)
+            finally:
+                with self._cond:
+                    self._ocupadas.discard(camera_stream)
+                    # A câmera pode ter recebido outro quadro enquanto isso
+                    self._cond.notify()
+
+class GerenciadorCameras:
+    """Uma captura por câmera (esteira), com detecção no pool compartilhado
+    
+    A primeira câmera adicionada é a principal, servida pelas rotas sem
+    nome de câmera.
+    """
+    def __init__(self, pool_deteccao):
+        self.pool_deteccao = pool_deteccao
+        self.cameras = OrderedDict()
+        self.codificadores_hls = {}
+    
+    def adicionar(self, camera_stream):
+        """Registra uma câmera já iniciada e cria seu codificador HLS"""
+        self.cameras[camera_stream.nome] = camera_stream
+        self.codificadores_hls[camera_stream.nome] = CodificadorHLS(
+            camera_stream, os.path.join(HLS_DIRETORIO, camera_stream.nome))
+    
+    def obter(self, nome=None):
+        """Câmera pelo nome, ou a principal; None se não existir"""
+        if nome is None:
+            return next(iter(self.cameras.values()), None)
+        return self.cameras.get(nome)
+    
+    def dispositivos_livres(self, camera_stream):
+        """Câmeras detectadas que não estão em uso por outra captura"""
+        em_uso = {outra.camera_index for outra in self.cameras.values() if outra is not camera_stream}
+        return detect_cameras(ignorar=em_uso)
+    
+    def obter_hls(self, nome=None):
+        camera_stream = self.obter(nome)
+        return self.codificadores_hls.get(camera_stream.nome) if camera_stream else None
+    
+    def get_status(self):
+        return {
+            nome: {
+                "dispositivo": str(camera_stream.camera_index),
+                "running": camera_stream.running,
+                **camera_stream.get_saude(),
+                "visualizadores": camera_stream.get_assinantes(),
+                "hls_ativo": self.codificadores_hls[nome].ativo,
+                "quadros_descartados": self.pool_deteccao.descartados.get(nome, 0)
+            }
+            for nome, camera_stream in self.cameras.items()
+        }
+    
+    def parar(self):
+        for camera_stream in self.cameras.values():
+            camera_stream.stop()
+
+# ==============================
+# ARMAZÉM DE RECORTES
+# ==============================
+class ArmazemRecortes:
+    """Recortes JPEG das peças detectadas, endereçados pelo hash do conteúdo
+    
+    Os arquivos ficam em disco com tamanho total limitado; ao passar do
+    limite, os recortes acessados há mais tempo são removidos (LRU). A
+    gravação é feita por uma thread própria para não atrasar o pipeline.
+    """
+    def __init__(self, diretorio=RECORTES_DIRETORIO, tamanho_maximo=RECORTES_TAMANHO_MAXIMO):
+        self.diretorio = diretorio
+        self.tamanho_maximo = tamanho_maximo
+        self._lock = threading.Lock()
+        self._indice = OrderedDict()
+        self._pendentes = {}
+        self._total_bytes = 0
+        self._fila = queue.Queue(maxsize=RECORTES_FILA)
+        self._thread = None
+    
+    def iniciar(self):
+        """Carrega recortes existentes (mais antigos primeiro) e inicia a gravação"""
+        os.makedirs(self.diretorio, exist_ok=True)
+        arquivos = []
+        for nome in os.listdir(self.diretorio):
+            if nome.endswith(".jpg"):
+                info = os.stat(os.path.join(self.diretorio, nome))
+                arquivos.append((info.st_mtime, nome[:-4], info.st_size))
+        with self._lock:
+            for _, id_recorte, tamanho in sorted(arquivos):
+                self._indice[id_recorte] = tamanho
+                self._total_bytes += tamanho
+        self._remover_excedentes()
+        
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._gravar, name="recortes", daemon=True)
+            self._thread.start()
+        log_recortes.info("%d recortes em disco (%d KB)", len(self._indice), self._total_bytes // 1024)
+    
+    def _caminho(self, id_recorte):
+        return os.path.join(self.diretorio, f"{id_recorte}.jpg")
+    
+    def salvar(self, imagem, deteccao):
+        """Recorta a peça detectada e agenda a gravação
+        
+        Returns:
+            str | None: id do recorte, ou None se a fila de gravação estiver cheia
+        """
+        x, y = deteccao["centro"]
+        raio = int(deteccao["raio"] * RECORTES_MARGEM) + 2
+        altura, largura = imagem.shape[:2]
+        recorte = imagem[max(0, y - raio):min(altura, y + raio), max(0, x - raio):min(largura, x + raio)]
+        if recorte.size == 0:
+            return None
+        
+        ret, buffer = cv2.imencode('.jpg', recorte, [cv2.IMWRITE_JPEG_QUALITY, RECORTES_JPEG_QUALIDADE])
+        dados = buffer.tobytes()
+        id_recorte = hashlib.sha1(dados).hexdigest()[:20]
+        
+        with self._lock:
+            if id_recorte in self._indice:
+                self._indice.move_to_end(id_recorte)
+                return id_recorte
+            if id_recorte in self._pendentes:
+                return id_recorte
+            self._pendentes[id_recorte] = dados
+        
+        try:
+            self._fila.put_nowait(id_recorte)
+        except queue.Full:
+            with self._lock:
+                self._pendentes.pop(id_recorte, None)
+            return None
+        return id_recorte
+    
+    def ler(self, id_recorte):
+        """Retorna os bytes do recorte e o marca como usado recentemente"""
+        with self._lock:
+            dados = self._pendentes.get(id_recorte)
+            if dados is not None:
+                return dados
+            if id_recorte not in self._indice:
+                return None
+            self._indice.move_to_end(id_recorte)
+        
+        caminho = self._caminho(id_recorte)
+        try:
+            with open(caminho, "rb") as arquivo:
+                dados = arquivo.read()
+            # Mantém a ordem de uso entre reinícios
+            os.utime(caminho)
+        except FileNotFoundError:
+            return None
+        return dados
+    
+    def _gravar(self):
+        while True:
+            id_recorte = self._fila.get()
+            with self._lock:
+                dados = self._pendentes.get(id_recorte)
+            if dados is None:
+                continue
+            
+            caminho = self._caminho(id_recorte)
+            try:
+                temporario = caminho + ".tmp"
+                with open(temporario, "wb") as arquivo:
+                    arquivo.write(dados)
+                os.replace(temporario, caminho)
+            except OSError as e:
+                log_recortes.error("Erro ao gravar recorte: %s", e)
+                with self._lock:
+                    self._pendentes.pop(id_recorte, None)
+                continue
+            
+            with self._lock:
+                self._pendentes.pop(id_recorte, None)
+                self._indice[id_recorte] = len(dados)
+                self._total_bytes += len(dados)
+            self._remover_excedentes()
+    
+    def _remover_excedentes(self):
+        """Remove os recortes menos usados até respeitar o tamanho máximo"""
+        while True:
+            with self._lock:
+                if self._total_bytes <= self.tamanho_maximo or not self._indice:
+                    return
+                id_recorte, tamanho = self._indice.popitem(last=False)
+                self._total_bytes -= tamanho
+            try:
+                os.remove(self._caminho(id_recorte))
+            except FileNotFoundError:
+                pass
+    
+    def get_status(self):
+        with self._lock:
+            return {"quantidade": len(self._indice), "bytes": self._total_bytes,
+                    "limite_bytes": self.tamanho_maximo}
+
+# ==============================
+# STREAM H.264 (HLS)
+# ==============================
+class CodificadorHLS:
+    """Codifica o stream anotado em H.264 (ffmpeg/libx264) em segmentos HLS fMP4
+    
+    Um único codificador é compartilhado por todos os visualizadores. Ele é
+    iniciado no primeiro acesso e encerrado após HLS_TIMEOUT_OCIOSO_S sem
+    requisições de playlist ou segmentos.
+    
+    O pool de detecção descarta quadros quando atrasa, então os quadros
+    chegam em intervalos irregulares. O ffmpeg usa o relógio de chegada
+    como timestamp e repete ou descarta quadros para manter a taxa do
+    perfil, e o vídeo anda no tempo real.
+    """
+    TIPOS_ARQUIVO = {
+        ".m3u8": "application/vnd.apple.mpegurl",
+        ".m4s": "video/iso.segment",
+        ".mp4": "video/mp4",
+    }
+
+    def __init__(self, camera_stream, diretorio=HLS_DIRETORIO):
+        self.camera_stream = camera_stream
+        self.diretorio = diretorio
+        self.ffmpeg = shutil.which("ffmpeg")
+        self._lock = threading.Lock()
+        self._thread = None
+        self._encerrando = False
+        self._ultimo_acesso = 0
+        if not self.ffmpeg:
+            log_hls.warning("ffmpeg não encontrado, stream H.264 indisponível")
+    
+    @property
+    def playlist(self):
+        return os.path.join(self.diretorio, "index.m3u8")
+    
+    @property
+    def ativo(self):
+        return self._thread is not None and self._thread.is_alive() and not self._encerrando
+    
+    def garantir_ativo(self):
+        """Registra acesso de um visualizador e inicia o codificador se estiver parado"""
+        if not self.ffmpeg:
+            return False
+        with self._lock:
+            self._ultimo_acesso = time.monotonic()
+            if not self.ativo:
+                if self._thread is not None:
+                    # O anterior pode estar removendo o diretório da playlist
+                    self._thread.join()
+                self._encerrando = False
+                self._thread = threading.Thread(target=self._alimentar, name="hls", daemon=True)
+                self._thread.start()
+        return True
+    
+    def aguardar_playlist(self, timeout):
+        """Aguarda o primeiro segmento ser gerado"""
+        limite = time.monotonic() + timeout
+        while not os.path.exists(self.playlist) and time.monotonic() < limite:
+            time.sleep(0.1)
+        return os.path.exists(self.playlist)
+    
+    def _iniciar_processo(self, largura, altura):
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+        os.makedirs(self.diretorio, exist_ok=True)
+        comando = [
+            self.ffmpeg, "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{largura}x{altura}",
+            "-framerate", str(perfis["fps"]), "-use_wallclock_as_timestamps", "1", "-i", "-",
+            "-fps_mode", "cfr", "-r", str(perfis["fps"]),
+            "-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency",
+            "-pix_fmt", "yuv420p", "-b:v", perfis["hls_bitrate"], "-maxrate", perfis["hls_bitrate"],
+            "-bufsize", perfis["hls_bitrate"], "-g", str(perfis["fps"] * HLS_DURACAO_SEGMENTO),
+            "-f", "hls", "-hls_time", str(HLS_DURACAO_SEGMENTO),
+            "-hls_list_size", str(HLS_SEGMENTOS_PLAYLIST),
+            "-hls_flags", "delete_segments+independent_segments",
+            "-hls_segment_type", "fmp4",
+            self.playlist,
+        ]
+        return subprocess.Popen(comando, stdin=subprocess.PIPE,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    
+    def _alimentar(self):
+        """Envia quadros anotados ao ffmpeg enquanto houver visualizadores"""
+        log_hls.info("%s: codificador H.264 iniciado", self.camera_stream.nome)
+        processo = None
+        tamanho = None
+        ultimo_seq = 0
+        try:
+            while True:
+                with self._lock:
+                    # Decidido sob o lock: um acesso concorrente ou mantém o
+                    # codificador ativo ou já o vê encerrando e inicia outro
+                    if (not self.camera_stream.running
+                            or time.monotonic() - self._ultimo_acesso >= HLS_TIMEOUT_OCIOSO_S):
+                        self._encerrando = True
+                        break
+                
+                quadro = self.camera_stream.aguardar_quadro(ultimo_seq)
+                if quadro is None:
+                    continue
+                ultimo_seq = quadro.seq
+                
+                imagem = self.camera_stream.anotar(quadro)
+                altura, largura = imagem.shape[:2]
+                if processo is None:
+                    tamanho = (largura, altura)
+                    processo = self._iniciar_processo(largura, altura)
+                elif (largura, altura) != tamanho:
+                    imagem = cv2.resize(imagem, tamanho)
+                processo.stdin.write(imagem.tobytes())
+        except OSError as e:
+            log_hls.error("%s: erro no codificador: %s", self.camera_stream.nome, e)
+        finally:
+            if not self._encerrando:
+                with self._lock:
+                    self._encerrando = True
+            if processo:
+                try:
+                    processo.stdin.close()
+                    processo.wait(timeout=5)
+                except Exception:
+                    processo.kill()
+            shutil.rmtree(self.diretorio, ignore_errors=True)
+            log_hls.info("%s: codificador H.264 parado", self.camera_stream.nome)
+
 # ==============================
 # FLASK APP COM CORS
 # ==============================
@@ -868,125 +2884,345 @@ CORS(app, resources={
     r"/*": {
         "origins": ["*"],
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Accept"],
+        "allow_headers": ["Content-Type", "Accept", "If-None-Match"],
+        "expose_headers": ["ETag", "X-Frame-Seq"],
         "max_age": 3600
     }
 })
 
-system_state = SystemState()
-gpio_controller = GPIOController()
-lcd_controller = LCDController()
-mqtt_handler = MQTTHandler(system_state, lcd_controller)
-camera_stream = None
+barramento_eventos = BarramentoEventos()
+armazem_recortes = ArmazemRecortes()
+taxas_pecas = TaxasPecas()
+system_state = SystemState(barramento_eventos=barramento_eventos)
+gpio_controller = GPIOController(inicializar=False)
+lcd_controller = LCDController(inicializar=False)
+medidor_latencia = MedidorLatencia()
+if MQTT_LOCAL_BROKER:
+    mqtt_handler = MQTTHandler(system_state, lcd_controller, medidor_latencia,
+                               broker=MQTT_LOCAL_BROKER, porta=MQTT_LOCAL_PORT,
+                               usuario=MQTT_LOCAL_USER, senha=MQTT_LOCAL_PASSWORD, tls=False)
+    ponte_mqtt = PonteMQTT()
+else:
+    mqtt_handler = MQTTHandler(system_state, lcd_controller, medidor_latencia)
+    ponte_mqtt = None
+agendador_atuacao = AgendadorAtuacao(gpio_controller)
+monitor_rede = MonitorRede(mqtt_handler)
+inicializacao = InicializacaoSistema()
+gerenciador_cameras = GerenciadorCameras(PoolDeteccao())
+deteccao_remota = ClienteDeteccaoRemota()
 
 @app.route("/camera_ia")
-def camera_ia():
-    """Endpoint de streaming com IA"""
+@app.route("/camera_ia/<cam>")
+def camera_ia(cam=None):
+    """Endpoint de streaming com IA (sem <cam>, câmera principal)"""
+    camera_stream = gerenciador_cameras.obter(cam)
     if not camera_stream or not camera_stream.running:
         return jsonify({"error": "Camera not running"}), 503
     
-    return Response(camera_stream.generate_frames(),
+    overlay = request.args.get("overlay", "1") != "0"
+    return Response(camera_stream.generate_frames(overlay),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route("/camera_ia/hls/<path:arquivo>")
+@app.route("/camera_ia/<cam>/hls/<path:arquivo>")
+def camera_ia_hls(arquivo, cam=None):
+    """Stream H.264 em HLS (fMP4): abrir /camera_ia/hls/index.m3u8 no player"""
+    camera_stream = gerenciador_cameras.obter(cam)
+    codificador_hls = gerenciador_cameras.obter_hls(cam)
+    if not camera_stream or not camera_stream.running or not codificador_hls:
+        return jsonify({"error": "Camera not running"}), 503
+    if not codificador_hls.garantir_ativo():
+        return jsonify({"error": "H.264 encoder not available"}), 503
+    
+    if arquivo == "index.m3u8" and not codificador_hls.aguardar_playlist(HLS_DURACAO_SEGMENTO * 3 + 2):
+        return jsonify({"error": "Stream starting, try again"}), 503
+    
+    mimetype = CodificadorHLS.TIPOS_ARQUIVO.get(os.path.splitext(arquivo)[1])
+    if mimetype is None:
+        return jsonify({"error": "Not found"}), 404
+    
+    response = send_from_directory(codificador_hls.diretorio, arquivo, mimetype=mimetype)
+    if arquivo.endswith(".m3u8"):
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route("/camera_ia/metadados")
+@app.route("/camera_ia/<cam>/metadados")
+def camera_ia_metadados(cam=None):
+    """Stream só de metadados: geometria das detecções de cada quadro (NDJSON)"""
+    camera_stream = gerenciador_cameras.obter(cam)
+    if not camera_stream or not camera_stream.running:
+        return jsonify({"error": "Camera not running"}), 503
+    
+    return Response(camera_stream.generate_metadados(), mimetype='application/x-ndjson',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.route("/camera_ia")
 @app.route("/camera_ia/capture")
-def capture_frame():
-    """Captura um frame individual em JPEG"""
-    if not system_state.ultimo_frame is None:
-        ret, buffer = cv2.imencode('.jpg', system_state.ultimo_frame, 
-                                  [cv2.IMWRITE_JPEG_QUALITY, 95])
-        frame_bytes = buffer.tobytes()
-        
-        return Response(frame_bytes, 
-                       mimetype='image/jpeg',
-                       headers={
-                           'Content-Type': 'image/jpeg',
-                           'Cache-Control': 'no-cache, no-store, must-revalidate',
-                           'Pragma': 'no-cache',
-                           'Expires': '0'
-                       })
-    
-    return jsonify({"error": "No frame available"}), 503
+@app.route("/camera_ia/<cam>/capture")
+def capture_frame(cam=None):
+    """Captura um frame individual em JPEG (?overlay=0 para frame sem anotações)
+    
+    Responde com ETag do quadro e devolve 304 se o cliente já tiver o
+    quadro atual (If-None-Match), sem codificar nem reenviar a imagem.
+    
+    Com ?after=<seq> a requisição fica aguardando até existir um quadro
+    mais novo que seq (ou até ?timeout=<s>, respondendo 204). O número do
+    quadro retornado vem no cabeçalho X-Frame-Seq.
+    """
+    camera_stream = gerenciador_cameras.obter(cam)
+    quadro = camera_stream.ultimo_quadro if camera_stream else None
+    if quadro is None:
+        return jsonify({"error": "No frame available"}), 503
+    
+    variante = "captura" if request.args.get("overlay", "1") != "0" else "cru"
+    apos_seq = request.args.get("after", type=int)
+    if apos_seq is not None:
+        # Seq maior que o atual indica que a captura reiniciou
+        if apos_seq > quadro.seq:
+            apos_seq = 0
+        timeout = min(request.args.get("timeout", LONGPOLL_TIMEOUT_PADRAO, type=float),
+                      LONGPOLL_TIMEOUT_MAXIMO)
+        quadro = camera_stream.aguardar_quadro(apos_seq, timeout, proximo=True)
+        if quadro is None:
+            return Response(status=204, headers={'X-Frame-Seq': str(apos_seq)})
+    
+    return resposta_quadro(camera_stream, quadro, variante)
+
+def resposta_quadro(camera_stream, quadro, variante):
+    """Resposta JPEG de um quadro com ETag e suporte a If-None-Match"""
+    headers = {
+        'Cache-Control': 'no-cache',
+        'X-Frame-Seq': str(quadro.seq)
+    }
+    etag = camera_stream.etag(quadro, variante)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304, headers=headers)
+    else:
+        frame_bytes = camera_stream.obter_jpeg(quadro, variante, perfis["jpeg_captura"])
+        response = Response(frame_bytes, mimetype='image/jpeg', headers=headers)
+    response.set_etag(etag)
+    return response
 
 @app.route("/status")
 def status():
     """Endpoint de status do sistema"""
+    estado = system_state.get_status()
+    camera_stream = gerenciador_cameras.obter()
+    codificador_hls = gerenciador_cameras.obter_hls()
     return jsonify({
         "mqtt_connected": mqtt_handler.connected,
+        "mqtt_broker": f"{mqtt_handler.broker}:{mqtt_handler.porta}",
+        "mqtt_ponte": ponte_mqtt.get_status() if ponte_mqtt else None,
+        "mqtt_outbox_pendentes": len(mqtt_handler.outbox),
+        "mqtt_mensagens_descartadas": mqtt_handler.mensagens_descartadas,
         "camera_running": camera_stream.running if camera_stream else False,
-        "ip": get_local_ip(),
-        "esteira_ligada": system_state.esteira_ligada,
-        "cores_detectadas": system_state.cores_detectadas,
-        "ultima_cor": system_state.ultima_cor_detectada,
+        "visualizadores": camera_stream.get_assinantes() if camera_stream else {},
+        "hls_ativo": codificador_hls.ativo if codificador_hls else False,
+        "cameras": gerenciador_cameras.get_status(),
+        "deteccao_remota": deteccao_remota.get_status(),
+        "recortes": armazem_recortes.get_status(),
+        "perfil": perfis.nome,
+        "ip": monitor_rede.ip_local,
+        "url_tunel": monitor_rede.url_tunel,
+        "esteira_ligada": estado["esteira_ligada"],
+        "cores_detectadas": estado["cores_detectadas"],
+        "contagens": estado["contagens"],
+        "pecas_por_minuto": taxas_pecas.resumo(),
+        "ultima_cor": estado["ultima_cor"],
+        "timestamp_ultima_deteccao": estado["timestamp"],
         "gpio_disponivel": gpio_controller.gpio_disponivel,
-        "lcd_disponivel": lcd_controller.lcd_disponivel
+        "lcd_disponivel": lcd_controller.lcd_disponivel,
+        "atuacao": agendador_atuacao.get_estatisticas()
     })
 
+@app.route("/detections/<id_recorte>.jpg")
+def detection_crop(id_recorte):
+    """Recorte JPEG de uma peça detectada (id vem do evento 'deteccao')"""
+    dados = armazem_recortes.ler(id_recorte) if id_recorte.isalnum() else None
+    if dados is None:
+        return jsonify({"error": "Not found"}), 404
+    
+    # Conteúdo endereçado por hash nunca muda
+    response = Response(dados, mimetype='image/jpeg',
+                        headers={'Cache-Control': 'public, max-age=31536000, immutable'})
+    response.set_etag(id_recorte)
+    return response
+
+@app.route("/events")
+def events():
+    """Feed local (Server-Sent Events) de detecções e estado da esteira
+    
+    Retoma a partir do cabeçalho Last-Event-ID ou do parâmetro ?desde=<id>.
+    """
+    apos_seq = barramento_eventos.interpretar_id(
+        request.headers.get("Last-Event-ID") or request.args.get("desde"))
+    
+    def gerar(apos_seq):
+        yield "retry: 2000\n\n"
+        while True:
+            eventos = barramento_eventos.aguardar(apos_seq, EVENTOS_KEEPALIVE_S)
+            if not eventos:
+                yield ": keepalive\n\n"
+                continue
+            for seq, tipo, conteudo in eventos:
+                yield f"id: {barramento_eventos.formatar_id(seq)}\nevent: {tipo}\ndata: {conteudo}\n\n"
+                apos_seq = seq
+    
+    return Response(gerar(apos_seq), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/perfil", methods=["GET", "POST"])
+def perfil():
+    """Perfil de desempenho ativo; POST {"perfil": "<nome>"} troca em tempo de execução"""
+    if request.method == "POST":
+        dados = request.get_json(silent=True) or {}
+        try:
+            perfis.selecionar(dados.get("perfil"))
+        except ValueError as e:
+            return jsonify({"error": str(e), "disponiveis": list(perfis.perfis)}), 400
+        for camera_stream in gerenciador_cameras.cameras.values():
+            camera_stream.reconfigurar()
+    return jsonify(perfis.get_status())
+
+@app.route("/latencia")
+def latencia():
+    """Percentis de latência por etapa (captura até publicação e recebimento no app)"""
+    return jsonify(medidor_latencia.get_resumo())
+
 @app.route("/health")
 def health():
-    """Health check"""
-    return jsonify({"status": "ok"}), 200
+    """Health check com prontidão de cada subsistema
+    
+    Responde 503 enquanto o estado geral não for "ok" (iniciando,
+    degradado ou com falha), para balanceadores e supervisores.
+    """
+    status_inicializacao = inicializacao.get_status()
+    status_inicializacao["mqtt_conectado"] = mqtt_handler.connected
+    camera_stream = gerenciador_cameras.obter()
+    status_inicializacao["camera_running"] = camera_stream.running if camera_stream else False
+    status_inicializacao["cameras"] = {
+        nome: stream.get_saude() for nome, stream in gerenciador_cameras.cameras.items()
+    }
+    # Câmera sem frames recentes deixa o sistema degradado mesmo após o boot
+    if (status_inicializacao["status"] == "ok"
+            and any(saude["estado"] != "ok" for saude in status_inicializacao["cameras"].values())):
+        status_inicializacao["status"] = "degradado"
+    codigo = 200 if status_inicializacao["status"] == "ok" else 503
+    return jsonify(status_inicializacao), codigo
 
 @app.before_request
 def handle_preflight():
     """Handle CORS preflight requests"""
-    from flask import request
     if request.method == "OPTIONS":
         response = jsonify({"status": "ok"})
         response.headers.add("Access-Control-Allow-Origin", "*")
-        response.headers.add("Access-Control-Allow-Headers", "Content-Type,Accept")
+        response.headers.add("Access-Control-Allow-Headers", "Content-Type,Accept,If-None-Match")
         response.headers.add("Access-Control-Allow-Methods", "GET,POST,OPTIONS")
         return response
 
 # ==============================
 # MAIN
 # ==============================
-if __name__ == "__main__":
-    print("=" * 50)
-    print("SISTEMA DE DETECÇÃO LEGO - INICIANDO")
-    print("=" * 50)
-    
-    # Detecta câmera
-    camera_index = detect_camera()
-    if camera_index is None:
-        print("❌ Nenhuma câmera detectada")
-        exit(1)
+def inicializar_rede():
+    """Inicia monitor de IP local e túnel"""
+    monitor_rede.iniciar()
+    log_sistema.info("IP Local: %s", monitor_rede.ip_local)
+
+def inicializar_gpio():
+    """Inicializa GPIO e o agendador dos ejetores"""
+    gpio_controller.inicializar()
+    agendador_atuacao.iniciar()
+
+def inicializar_camera():
+    """Detecta as câmeras e inicia uma captura por câmera
     
-    # Obtém IP local
-    ip = get_local_ip()
-    print(f"\n[SISTEMA] IP Local: {ip}")
+    Os ejetores ficam associados à câmera principal (a primeira).
+    """
+    dispositivos = CAMERAS_DISPOSITIVOS if CAMERAS_DISPOSITIVOS is not None else detect_cameras()
+    if not dispositivos:
+        raise Exception("Nenhuma câmera detectada")
     
-    # Conecta MQTT
-    print("\n[MQTT] Conectando ao broker...")
-    if mqtt_handler.connect(ip):
-        print("[MQTT] ✓ MQTT conectado e pronto!")
-    else:
-        print("[MQTT] ⚠️ Falha ao conectar MQTT, continuando sem MQTT")
+    armazem_recortes.iniciar()
+    gerenciador_cameras.pool_deteccao.iniciar()
+    for i, dispositivo in enumerate(dispositivos):
+        stream = CameraStream(dispositivo, mqtt_handler, system_state,
+                              agendador_atuacao if i == 0 else None,
+                              medidor_latencia, barramento_eventos, armazem_recortes,
+                              nome=f"cam{i}", pool_deteccao=gerenciador_cameras.pool_deteccao,
+                              deteccao_remota=deteccao_remota,
+                              redescobrir=gerenciador_cameras.dispositivos_livres,
+                              taxas_pecas=taxas_pecas)
+        try:
+            stream.start_capture()
+        except Exception as e:
+            log_camera.error("cam%d: falha ao iniciar (%s): %s", i, dispositivo, e)
+            continue
+        gerenciador_cameras.adicionar(stream)
     
-    # Inicializa stream
-    camera_stream = CameraStream(camera_index, mqtt_handler, system_state)
-    camera_stream.start_capture()
+    if not gerenciador_cameras.cameras:
+        raise Exception("Nenhuma câmera pôde ser iniciada")
+
+def exibir_resumo():
+    """Mostra informações do sistema quando todos os subsistemas terminarem"""
+    inicializacao.aguardar()
+    ip = monitor_rede.ip_local
+    status_inicializacao = inicializacao.get_status()
     
-    # Mostra informações
     print("\n" + "=" * 50)
-    print(f"✅ SISTEMA PRONTO!")
+    print(f"{'✅ SISTEMA PRONTO!' if status_inicializacao['status'] == 'ok' else '⚠️ SISTEMA DEGRADADO'}")
+    for nome, info in status_inicializacao["subsistemas"].items():
+        print(f"   {nome}: {info['estado']}" + (f" ({info['erro']})" if info["erro"] else ""))
     print(f"📹 Acessar câmera IA: http://{ip}:5000/camera_ia")
+    for nome in list(gerenciador_cameras.cameras)[1:]:
+        print(f"📹 Câmera {nome}: http://{ip}:5000/camera_ia/{nome}")
     print(f"📸 Capturar frame: http://{ip}:5000/camera_ia/capture")
     print(f"📊 Status do sistema: http://{ip}:5000/status")
-    print(f"📡 MQTT Status: {'Conectado' if mqtt_handler.connected else 'Desconectado'}")
+    print(f"📡 MQTT Status: {'Conectado' if mqtt_handler.connected else 'Desconectado'} ({mqtt_handler.broker})")
     print(f"📡 Tópico de cores e IP: {MQTT_TOPIC}")
     print(f"📡 Tópico de controle: {APP_CONTROL_TOPIC}")
+    print(f"📡 Tópico de resumo: {RESUMO_TOPIC}")
     print(f"📡 Tópico de solicitação: {SOLICITAR_IP_TOPIC}")
+    if deteccao_remota.ativo:
+        print(f"🖥️  Detecção remota: {', '.join(w.endereco for w in deteccao_remota.workers)}")
     print(f"🎛️  GPIO: {'Disponível' if gpio_controller.gpio_disponivel else 'Simulação'}")
     print(f"📺 LCD: {'Configurado' if lcd_controller.lcd_disponivel else 'Preparado'}")
     print("=" * 50 + "\n")
+
+if __name__ == "__main__":
+    from werkzeug.serving import make_server
+
+    print("=" * 50)
+    print("SISTEMA DE DETECÇÃO LEGO - INICIANDO")
+    print("=" * 50)
+    
+    # Abre o servidor HTTP antes dos subsistemas para o /health responder desde o boot
+    servidor = make_server("0.0.0.0", 5000, app, threaded=True)
+    log_sistema.info("Servidor HTTP escutando na porta 5000")
+    
+    # Inicializa subsistemas em paralelo
+    inicializacao.registrar("rede", inicializar_rede)
+    inicializacao.registrar("gpio", inicializar_gpio)
+    inicializacao.registrar("lcd", lcd_controller.inicializar)
+    inicializacao.registrar("mqtt", mqtt_handler.connect, prontidao=lambda: mqtt_handler.connected)
+    if ponte_mqtt:
+        inicializacao.registrar("ponte_mqtt", ponte_mqtt.iniciar)
+    inicializacao.registrar("camera", inicializar_camera)
+    threading.Thread(target=exibir_resumo, name="resumo", daemon=True).start()
+    taxas_pecas.iniciar(mqtt_handler)
     
     try:
-        app.run(host="0.0.0.0", port=5000, threaded=True, debug=False)
+        servidor.serve_forever()
     except KeyboardInterrupt:
-        print("\n[SISTEMA] Encerrando...")
+        log_sistema.info("Encerrando...")
     finally:
-        camera_stream.stop()
-        mqtt_handler.client.loop_stop()
+        servidor.server_close()
+        monitor_rede.parar()
+        taxas_pecas.parar()
+        gerenciador_cameras.parar()
+        deteccao_remota.parar()
+        mqtt_handler.parar()
+        if ponte_mqtt:
+            ponte_mqtt.parar()
         gpio_controller.cleanup()
-        cv2.destroyAllWindows()
\ No newline at end of file
+        cv2.destroyAllWindows()
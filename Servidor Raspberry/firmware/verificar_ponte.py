@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Verificação da ponte MQTT local <-> nuvem
+
+Sobe dois brokers MQTT 3.1.1 mínimos em memória, um no papel do broker
+local e outro no do HiveMQ, e confere com a PonteMQTT do
+transmissao_camera.py que:
+
+- sem a nuvem, as mensagens comuns ficam na fila offline e sobem em ordem
+  ao conectar, e as de PONTE_SEM_FILA são descartadas;
+- os tópicos de PONTE_RETIDOS chegam à nuvem retidos, só com o último valor;
+- com a nuvem conectada, o que sobe e o que desce é encaminhado na hora.
+
+Não precisa de internet nem de mosquitto.
+
+Uso: python verificar_ponte.py
+"""
+
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from transmissao_camera import (
+    APP_CONTROL_TOPIC,
+    MQTT_TOPIC,
+    RESUMO_TOPIC,
+    TELEMETRIA_STATUS_TOPIC,
+    PonteMQTT,
+)
+
+CONNECT, CONNACK, PUBLISH, PUBACK, SUBSCRIBE, SUBACK = 1, 2, 3, 4, 8, 9
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+class BrokerTeste:
+    """Broker MQTT 3.1.1 mínimo para testes
+
+    Aceita QoS 0 e 1, entrega sempre em QoS 0, guarda as mensagens
+    retidas e, como um broker real, limpa o RETAIN nas entregas ao vivo.
+    A porta é reservada na criação, mas as conexões só são aceitas depois
+    de iniciar(); até lá o broker se comporta como fora do ar.
+    """
+    def __init__(self):
+        self._servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._servidor.bind(("127.0.0.1", 0))
+        self.porta = self._servidor.getsockname()[1]
+        self.recebidas = []  # (tópico, payload, retain) na ordem de chegada
+        self.retidas = {}
+        self._assinaturas = {}
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        self._servidor.listen()
+        threading.Thread(target=self._aceitar, daemon=True).start()
+
+    def parar(self):
+        self._servidor.close()
+        with self._lock:
+            for conexao in self._assinaturas:
+                conexao.close()
+
+    def inscrito(self, topico):
+        """True se algum cliente assina um filtro que cobre o tópico"""
+        with self._lock:
+            return any(mqtt.topic_matches_sub(filtro, topico)
+                       for filtros in self._assinaturas.values() for filtro in filtros)
+
+    def _aceitar(self):
+        while True:
+            try:
+                conexao, _ = self._servidor.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._atender, args=(conexao,), daemon=True).start()
+
+    def _atender(self, conexao):
+        with self._lock:
+            self._assinaturas[conexao] = []
+        try:
+            while True:
+                tipo, flags, corpo = _ler_pacote(conexao)
+                if tipo == CONNECT:
+                    conexao.sendall(bytes([CONNACK << 4, 2, 0, 0]))
+                elif tipo == PUBLISH:
+                    self._receber_publish(conexao, flags, corpo)
+                elif tipo == SUBSCRIBE:
+                    self._receber_subscribe(conexao, corpo)
+                elif tipo == PINGREQ:
+                    conexao.sendall(bytes([PINGRESP << 4, 0]))
+                elif tipo == DISCONNECT:
+                    break
+        except (OSError, ConnectionError):
+            pass
+        finally:
+            with self._lock:
+                self._assinaturas.pop(conexao, None)
+            conexao.close()
+
+    def _receber_publish(self, conexao, flags, corpo):
+        tamanho = struct.unpack(">H", corpo[:2])[0]
+        topico = corpo[2:2 + tamanho].decode()
+        inicio = 2 + tamanho
+        if (flags >> 1) & 3:
+            conexao.sendall(bytes([PUBACK << 4, 2]) + corpo[inicio:inicio + 2])
+            inicio += 2
+        payload = corpo[inicio:]
+        retain = bool(flags & 1)
+
+        with self._lock:
+            self.recebidas.append((topico, payload, retain))
+            if retain:
+                if payload:
+                    self.retidas[topico] = payload
+                else:
+                    self.retidas.pop(topico, None)
+            destinos = [c for c, filtros in self._assinaturas.items()
+                        if any(mqtt.topic_matches_sub(f, topico) for f in filtros)]
+        for destino in destinos:
+            try:
+                destino.sendall(_pacote_publish(topico, payload, retain=False))
+            except OSError:
+                pass
+
+    def _receber_subscribe(self, conexao, corpo):
+        filtros = []
+        i = 2
+        while i < len(corpo):
+            tamanho = struct.unpack(">H", corpo[i:i + 2])[0]
+            filtros.append(corpo[i + 2:i + 2 + tamanho].decode())
+            i += 3 + tamanho
+        conexao.sendall(bytes([SUBACK << 4, 2 + len(filtros)]) + corpo[:2] + bytes(len(filtros)))
+
+        with self._lock:
+            self._assinaturas[conexao].extend(filtros)
+            retidas = [(t, p) for t, p in self.retidas.items()
+                       if any(mqtt.topic_matches_sub(f, t) for f in filtros)]
+        for topico, payload in retidas:
+            conexao.sendall(_pacote_publish(topico, payload, retain=True))
+
+def _ler_pacote(conexao):
+    """Lê um pacote MQTT: (tipo, flags, corpo)"""
+    cabecalho = _receber_exato(conexao, 1)[0]
+    tamanho, multiplicador = 0, 1
+    while True:
+        byte = _receber_exato(conexao, 1)[0]
+        tamanho += (byte & 0x7F) * multiplicador
+        multiplicador *= 128
+        if not byte & 0x80:
+            break
+    return cabecalho >> 4, cabecalho & 0x0F, _receber_exato(conexao, tamanho)
+
+def _receber_exato(conexao, tamanho):
+    dados = b""
+    while len(dados) < tamanho:
+        parte = conexao.recv(tamanho - len(dados))
+        if not parte:
+            raise ConnectionError("conexão encerrada")
+        dados += parte
+    return dados
+
+def _pacote_publish(topico, payload, retain):
+    """PUBLISH em QoS 0"""
+    corpo = struct.pack(">H", len(topico)) + topico.encode() + payload
+    tamanho = len(corpo)
+    codificado = b""
+    while True:
+        byte = tamanho % 128
+        tamanho //= 128
+        codificado += bytes([byte | (0x80 if tamanho else 0)])
+        if not tamanho:
+            break
+    return bytes([PUBLISH << 4 | int(retain)]) + codificado + corpo
+
+def aguardar(condicao, timeout=10):
+    limite = time.monotonic() + timeout
+    while not condicao() and time.monotonic() < limite:
+        time.sleep(0.05)
+    return condicao()
+
+def cliente_teste(porta, client_id):
+    client = mqtt.Client(client_id=client_id)
+    client.connect("127.0.0.1", porta)
+    client.loop_start()
+    return client
+
+falhas = []
+
+def verificar(descricao, condicao):
+    print(("✓ " if condicao else "✗ ") + descricao)
+    if not condicao:
+        falhas.append(descricao)
+
+def main():
+    local = BrokerTeste()
+    local.iniciar()
+    nuvem = BrokerTeste()  # só aceita conexões mais adiante
+
+    def na_nuvem(topico):
+        return [(payload, retain) for t, payload, retain in nuvem.recebidas if t == topico]
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        ponte = PonteMQTT(broker_local="127.0.0.1", porta_local=local.porta,
+                          broker_nuvem="127.0.0.1", porta_nuvem=nuvem.porta, tls_nuvem=False,
+                          arquivo_outbox=os.path.join(diretorio, "outbox_ponte.db"))
+        ponte.clientes["nuvem"].reconnect_delay_set(1, 1)
+        ponte.iniciar()
+        aguardar(lambda: local.inscrito(MQTT_TOPIC))
+
+        app_local = cliente_teste(local.porta, "app_local")
+        for i in range(3):
+            app_local.publish(MQTT_TOPIC, f"cor{i}", qos=1)
+        app_local.publish(TELEMETRIA_STATUS_TOPIC, b"status1", qos=1, retain=True)
+        app_local.publish(TELEMETRIA_STATUS_TOPIC, b"status2", qos=1, retain=True)
+        app_local.publish(RESUMO_TOPIC, "resumo", qos=1)
+
+        aguardar(lambda: ponte.get_status()["fila_offline"] == 3
+                 and ponte.get_status()["retidos_pendentes"] == 1)
+        status = ponte.get_status()
+        verificar("sem nuvem: mensagens comuns na fila offline", status["fila_offline"] == 3)
+        verificar("sem nuvem: só o último status aguardando", status["retidos_pendentes"] == 1)
+
+        nuvem.iniciar()
+        aguardar(lambda: len(na_nuvem(MQTT_TOPIC)) == 3 and na_nuvem(TELEMETRIA_STATUS_TOPIC))
+        verificar("ao conectar: a fila sobe em ordem",
+                  na_nuvem(MQTT_TOPIC) == [(b"cor0", False), (b"cor1", False), (b"cor2", False)])
+        verificar("ao conectar: o status sobe retido, só com o último valor",
+                  na_nuvem(TELEMETRIA_STATUS_TOPIC) == [(b"status2", True)])
+        verificar("PONTE_SEM_FILA não sobe depois", not na_nuvem(RESUMO_TOPIC))
+
+        app_local.publish(MQTT_TOPIC, "cor3", qos=1)
+        app_local.publish(TELEMETRIA_STATUS_TOPIC, b"status3", qos=1, retain=True)
+        aguardar(lambda: len(na_nuvem(MQTT_TOPIC)) == 4 and len(na_nuvem(TELEMETRIA_STATUS_TOPIC)) == 2)
+        verificar("conectado: mensagem comum encaminhada", na_nuvem(MQTT_TOPIC)[-1:] == [(b"cor3", False)])
+        verificar("conectado: status encaminhado retido",
+                  na_nuvem(TELEMETRIA_STATUS_TOPIC)[-1:] == [(b"status3", True)])
+        verificar("nuvem guarda o último status retido",
+                  nuvem.retidas.get(TELEMETRIA_STATUS_TOPIC) == b"status3")
+
+        aguardar(lambda: nuvem.inscrito(APP_CONTROL_TOPIC))
+        app_remoto = cliente_teste(nuvem.porta, "app_remoto")
+        app_remoto.publish(APP_CONTROL_TOPIC, "1", qos=1)
+        aguardar(lambda: any(t == APP_CONTROL_TOPIC for t, _, _ in local.recebidas))
+        verificar("comando do app desce para o broker local",
+                  (APP_CONTROL_TOPIC, b"1", False) in local.recebidas)
+
+        for client in (app_local, app_remoto):
+            client.disconnect()
+            client.loop_stop()
+        ponte.parar()
+    local.parar()
+    nuvem.parar()
+
+    print("Ponte OK" if not falhas else f"{len(falhas)} verificação(ões) falharam")
+    return 1 if falhas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Worker de detecção remota
+
+Roda em um computador da rede local e recebe quadros JPEG do Raspberry
+(transmissao_camera.py), devolvendo as detecções do LegoColorDetector
+com o mesmo número de sequência do quadro. O quadro já chega na largura
+de detecção do Raspberry e é detectado sem redimensionar, com o kernel
+do perfil ativo lá, então as coordenadas voltam na escala dele.
+
+Uso: python worker_deteccao.py [porta]
+No Raspberry, adicionar "<ip do computador>:<porta>" em DETECCAO_REMOTA_WORKERS.
+"""
+
+import json
+import socket
+import sys
+import threading
+
+import cv2
+import numpy as np
+
+from deteccao import (
+    DETECCAO_REMOTA_PORTA,
+    LegoColorDetector,
+    decodificar_pedido,
+    enviar_mensagem_deteccao,
+    receber_mensagem_deteccao,
+)
+
+def atender(conexao, endereco):
+    """Atende um cliente até a conexão ser encerrada"""
+    print(f"[WORKER] Cliente conectado: {endereco[0]}:{endereco[1]}")
+    conexao.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    detector = LegoColorDetector()
+    try:
+        while True:
+            seq, pedido = receber_mensagem_deteccao(conexao)
+            detector.tamanho_kernel, jpeg = decodificar_pedido(pedido)
+            frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+            deteccoes = []
+            if frame is not None:
+                _, deteccoes = detector.detectar_objetos(frame)
+            enviar_mensagem_deteccao(conexao, seq, json.dumps(deteccoes).encode())
+    except OSError:
+        pass
+    finally:
+        conexao.close()
+        print(f"[WORKER] Cliente desconectado: {endereco[0]}:{endereco[1]}")
+
+def main():
+    porta = int(sys.argv[1]) if len(sys.argv) > 1 else DETECCAO_REMOTA_PORTA
+    servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    servidor.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    servidor.bind(("0.0.0.0", porta))
+    servidor.listen()
+    print(f"[WORKER] Aguardando quadros na porta {porta}")
+    
+    try:
+        while True:
+            conexao, endereco = servidor.accept()
+            threading.Thread(target=atender, args=(conexao, endereco), daemon=True).start()
+    except KeyboardInterrupt:
+        print("\n[WORKER] Encerrando...")
+    finally:
+        servidor.close()
+
+if __name__ == "__main__":
+    main()